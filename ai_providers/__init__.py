@@ -0,0 +1 @@
+# AI Providers Package
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import deque
+import os
+import threading
+import time
+
+import numpy as np
+
+# Defaults for every provider; override per deployment with environment variables
+CALL_TIMEOUT = float(os.getenv('AI_CALL_TIMEOUT', '30'))
+MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4'))
+FAILURE_THRESHOLD = int(os.getenv('AI_FAILURE_THRESHOLD', '5'))
+COOLDOWN_SECONDS = float(os.getenv('AI_COOLDOWN_SECONDS', '30'))
+
+class ProviderError(Exception):
+    """Base class for failures raised by the provider-call layer itself"""
+
+class ProviderTimeoutError(ProviderError):
+    pass
+
+class ProviderBusyError(ProviderError):
+    pass
+
+class CircuitOpenError(ProviderError):
+    pass
+
+class ProviderGuard:
+    """Deadline, concurrency limit and circuit breaker around calls to one provider.
+
+    Calls run on a dedicated pool sized to the concurrency limit. A call that
+    misses its deadline is abandoned by the caller but keeps its slot until the
+    underlying request actually finishes, so a hung provider cannot grow the
+    number of outstanding requests. Pass the same deadline to the SDK client so
+    abandoned requests do finish. While abandoned calls hold slots, a busy
+    rejection counts as a failure, so a hung provider still opens the circuit.
+    """
+
+    def __init__(self, name, timeout=CALL_TIMEOUT, max_concurrency=MAX_CONCURRENCY,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f'{name}-call')
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._abandoned = 0
+        
+        self._counts = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'rejected': 0}
+        self._latencies = deque(maxlen=1000)
+
+    def _circuit_state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def _admit(self):
+        """Raise unless the breaker lets this call through (lock held)"""
+        state = self._circuit_state()
+        if state == 'open' or (state == 'half-open' and self._trial_in_flight):
+            self._counts['rejected'] += 1
+            raise CircuitOpenError(f'{self.name} is unavailable after repeated failures; retrying in {self.cooldown:g}s')
+        if state == 'half-open':
+            self._trial_in_flight = True
+
+    def _fail(self):
+        """Count a failure and open the circuit at the threshold or after a failed trial (lock held)"""
+        self._counts['failures'] += 1
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self.failure_threshold or self._opened_at is not None:
+            self._opened_at = time.monotonic()
+
+    def _record(self, success, latency, timed_out=False):
+        with self._lock:
+            self._latencies.append(latency)
+            self._trial_in_flight = False
+            if success:
+                self._counts['successes'] += 1
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            
+            if timed_out:
+                self._counts['timeouts'] += 1
+            self._fail()
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self._admit()
+            self._counts['calls'] += 1
+        
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+                self._trial_in_flight = False
+                if self._abandoned:
+                    # Slots are held by requests that already missed their deadline
+                    self._fail()
+            raise ProviderBusyError(f'{self.name} already has {self.max_concurrency} requests in flight')
+        
+        start = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        state = {'finished': False, 'abandoned': False}
+        
+        def release(_):
+            with self._lock:
+                state['finished'] = True
+                if state['abandoned']:
+                    self._abandoned -= 1
+            self._slots.release()
+        
+        future.add_done_callback(release)
+        
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                if not state['finished']:
+                    state['abandoned'] = True
+                    self._abandoned += 1
+            self._record(False, time.perf_counter() - start, timed_out=True)
+            raise ProviderTimeoutError(f'{self.name} did not respond within {timeout:g}s')
+        except Exception:
+            self._record(False, time.perf_counter() - start)
+            raise
+        
+        self._record(True, time.perf_counter() - start)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            return {
+                **self._counts,
+                'circuit': self._circuit_state(),
+                'consecutive_failures': self._consecutive_failures,
+                'abandoned_in_flight': self._abandoned,
+                'latency_ms': {
+                    'p50': float(np.percentile(latencies, 50)) if latencies.size else None,
+                    'p95': float(np.percentile(latencies, 95)) if latencies.size else None,
+                    'p99': float(np.percentile(latencies, 99)) if latencies.size else None,
+                },
+            }
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def get_guard(name, **settings):
+    """Return the shared guard for a provider, creating it on first use"""
+    with _guards_lock:
+        if name not in _guards:
+            _guards[name] = ProviderGuard(name, **settings)
+        return _guards[name]
+
+def call_provider(name, fn, *args, timeout=None, **kwargs):
+    """Call fn(*args, **kwargs) through the named provider's guard"""
+    return get_guard(name).call(fn, *args, timeout=timeout, **kwargs)
+
+def provider_metrics():
+    with _guards_lock:
+        guards = list(_guards.values())
+    return {guard.name: guard.metrics() for guard in guards}
+
+class FakeProvider:
+    """Local stand-in for a provider call, with injectable latency and failures"""
+
+    def __init__(self, delay=0.0, fail_every=0, response='fake response'):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.response = response
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        time.sleep(self.delay)
+        if self.fail_every and call_number % self.fail_every == 0:
+            raise RuntimeError('fake provider failure')
+        return self.response
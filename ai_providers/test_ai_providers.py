@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from ai_providers.ai_providers import (
+    CircuitOpenError, FakeProvider, ProviderBusyError, ProviderGuard, ProviderTimeoutError,
+)
+
+def test_deadline_raises_timeout_and_counts_failure():
+    guard = ProviderGuard('test', timeout=0.05, max_concurrency=2, failure_threshold=5, cooldown=60)
+    with pytest.raises(ProviderTimeoutError):
+        guard.call(FakeProvider(delay=0.3))
+
+    metrics = guard.metrics()
+    assert metrics['timeouts'] == 1
+    assert metrics['failures'] == 1
+    assert metrics['abandoned_in_flight'] == 1
+
+    # The slot comes back once the abandoned call really finishes
+    time.sleep(0.4)
+    assert guard.metrics()['abandoned_in_flight'] == 0
+    assert guard.call(FakeProvider()) == 'fake response'
+
+def test_busy_with_healthy_calls_is_not_a_failure():
+    guard = ProviderGuard('test', timeout=1, max_concurrency=1, failure_threshold=1, cooldown=60)
+    slow = threading.Thread(target=guard.call, args=(FakeProvider(delay=0.2),))
+    slow.start()
+    time.sleep(0.05)
+
+    with pytest.raises(ProviderBusyError):
+        guard.call(FakeProvider())
+    slow.join()
+
+    metrics = guard.metrics()
+    assert metrics['rejected'] == 1
+    assert metrics['failures'] == 0
+    assert metrics['circuit'] == 'closed'
+
+def test_breaker_opens_after_failures_and_closes_after_trial():
+    guard = ProviderGuard('test', timeout=1, max_concurrency=2, failure_threshold=2, cooldown=0.1)
+    failing = FakeProvider(fail_every=1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            guard.call(failing)
+
+    with pytest.raises(CircuitOpenError):
+        guard.call(failing)
+    assert failing.calls == 2
+    assert guard.metrics()['circuit'] == 'open'
+
+    time.sleep(0.15)
+    assert guard.metrics()['circuit'] == 'half-open'
+    assert guard.call(FakeProvider()) == 'fake response'
+    assert guard.metrics()['circuit'] == 'closed'
+
+def test_hung_provider_opens_breaker_through_busy_rejections():
+    # Fewer slots than the failure threshold: timeouts alone could never open the circuit
+    guard = ProviderGuard('test', timeout=0.05, max_concurrency=2, failure_threshold=3, cooldown=60)
+    hung = FakeProvider(delay=0.5)
+    for _ in range(2):
+        with pytest.raises(ProviderTimeoutError):
+            guard.call(hung)
+
+    with pytest.raises(ProviderBusyError):
+        guard.call(hung)
+    assert guard.metrics()['circuit'] == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        guard.call(hung)
+    assert hung.calls == 2
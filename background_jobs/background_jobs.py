@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import threading
+import time
+import uuid
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_TTL_SECONDS = 600  # Finished results are kept for 10 minutes
+MAX_JOBS = 64
+MAX_PENDING_JOBS = int(os.getenv('MAX_PENDING_JOBS', str(JOB_WORKERS * 2)))
+MAX_JOB_BYTES = int(os.getenv('MAX_JOB_MB', '512')) * 1024 * 1024  # Inputs, kept data and results together
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='background-job')
+_jobs = {}
+_lock = threading.Lock()
+
+class JobQueueFull(Exception):
+    """Raised by submit_job when the store is at its pending-job or memory limit"""
+
+def size_of(value):
+    """Approximate bytes held by arrays, strings and containers of them"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(size_of(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(size_of(item) for item in value)
+    return 0
+
+def _stored_bytes():
+    return sum(job['bytes'] for job in _jobs.values())
+
+def _expire_jobs(incoming_bytes=0):
+    """Drop expired jobs, then the oldest finished ones while over the count or byte limit (lock held)"""
+    now = time.time()
+    for job_id in [job_id for job_id, job in _jobs.items() if now - job['created'] > JOB_TTL_SECONDS and job['status'] != 'pending']:
+        del _jobs[job_id]
+    
+    finished = sorted((job['created'], job_id) for job_id, job in _jobs.items() if job['status'] != 'pending')
+    while finished and (len(_jobs) >= MAX_JOBS or _stored_bytes() + incoming_bytes > MAX_JOB_BYTES):
+        del _jobs[finished.pop(0)[1]]
+
+def _run_job(job, fn, args, kwargs):
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        status = 'done'
+    except Exception as e:
+        result = None
+        job['error'] = str(e)
+        status = 'error'
+    with _lock:
+        # The inputs are released with this call; only kept data and the result stay stored
+        job['result'] = result
+        job['bytes'] = size_of(job['data']) + size_of(result)
+        job['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        job['status'] = status
+
+def submit_job(fn, *args, data=None, **kwargs):
+    """Run fn(*args, **kwargs) on the worker pool and return a job id for polling.
+
+    `data` is kept alongside the job so later requests can reuse it (e.g. a
+    preview level for re-running with different parameters). Raises
+    JobQueueFull if MAX_PENDING_JOBS are already queued or running, or if the
+    job's inputs would push stored bytes past MAX_JOB_BYTES even after
+    evicting finished jobs; callers should fall back to working synchronously.
+    """
+    job = {
+        'status': 'pending',
+        'result': None,
+        'error': None,
+        'elapsed_ms': None,
+        'created': time.time(),
+        'data': data or {},
+        'bytes': size_of(data) + size_of(args) + size_of(kwargs),
+    }
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _expire_jobs(job['bytes'])
+        pending = sum(1 for queued in _jobs.values() if queued['status'] == 'pending')
+        if pending >= MAX_PENDING_JOBS:
+            raise JobQueueFull('Too many background jobs are pending')
+        if _stored_bytes() + job['bytes'] > MAX_JOB_BYTES:
+            raise JobQueueFull('Background job memory limit reached')
+        _jobs[job_id] = job
+    _executor.submit(_run_job, job, fn, args, kwargs)
+    return job_id
+
+def get_job(job_id):
+    """Return the job record, or None if it is unknown or has expired"""
+    with _lock:
+        return _jobs.get(job_id)
+
+def job_status(job_id):
+    """Return a JSON-serialisable summary of a job"""
+    job = get_job(job_id)
+    if job is None:
+        return {'status': 'missing', 'error': 'Job not found or expired'}
+    
+    status = {'status': job['status'], 'elapsed_ms': job['elapsed_ms']}
+    if job['status'] == 'done':
+        status['result'] = job['result']
+    elif job['status'] == 'error':
+        status['error'] = job['error']
+    return status
@@ -0,0 +1 @@
+# Batch Processor Package
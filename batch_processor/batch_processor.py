@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Offline batch processor: run normalize_image or apply_convolution over a whole
+image directory, outside the web server.
+
+Usage:
+    python -m batch_processor.batch_processor INPUT_DIR OUTPUT [options]
+
+Results go to a memory-mapped .npy stack (OUTPUT is a .npy file) or to image
+files (OUTPUT is a directory, with --output-format images). A JSONL manifest
+next to the output records every processed file so an interrupted run
+continues where it stopped.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_decoder.image_decoder import decode_image
+from image_filter_demo.image_filter import apply_convolution
+from image_normalizer.image_normalizer import normalize_image
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def find_images(input_dir):
+    """Walk a directory and return sorted image paths relative to it"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for filename in files:
+            if allowed_file(filename):
+                paths.append(os.path.relpath(os.path.join(root, filename), input_dir))
+    return sorted(paths)
+
+def process_image(image_array, operation, kernel):
+    """Apply the selected tool operation to one image array"""
+    if operation == 'normalize':
+        normalized_array, _ = normalize_image(image_array)
+        return normalized_array
+    return apply_convolution(image_array, np.array(kernel).reshape(3, 3))
+
+def process_file(task):
+    """Worker: decode, process and (for image output) save one file"""
+    index, rel_path, config = task
+    start = time.perf_counter()
+    try:
+        source_path = os.path.join(config['input_dir'], rel_path)
+        with open(source_path, 'rb') as f:
+            size = config['size']
+            image, _ = decode_image(f, target_size=size, mode='RGB')
+            if size is not None and image.size != size:
+                image = image.resize(size, Image.Resampling.BILINEAR)
+            result = process_image(np.array(image), config['operation'], config['kernel'])
+        
+        if config['output_format'] == 'images':
+            target_path = os.path.join(config['output'], os.path.splitext(rel_path)[0] + '.png')
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            Image.fromarray(result).save(target_path, format='PNG')
+            result = None
+        
+        return index, result, None, os.path.getsize(source_path), (time.perf_counter() - start) * 1000
+    except Exception as e:
+        return index, None, str(e), 0, (time.perf_counter() - start) * 1000
+
+def load_manifest(manifest_path, header):
+    """Return the set of finished indices from an existing manifest with a matching header"""
+    if not os.path.exists(manifest_path):
+        return None
+    
+    with open(manifest_path) as f:
+        existing_header = json.loads(f.readline())
+        if existing_header != header:
+            raise ValueError(f'{manifest_path} was written for a different run; remove it or use --restart.')
+        finished = set()
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # Partial last line from an interrupted run
+            if entry['status'] == 'ok':
+                finished.add(entry['index'])
+    return finished
+
+def output_shape(config, count):
+    """Shape of the .npy stack: normalize keeps RGB, the filter produces grayscale"""
+    width, height = config['size']
+    if config['operation'] == 'normalize':
+        return (count, height, width, 3)
+    return (count, height, width)
+
+def run_batch(config, workers, chunksize, restart=False):
+    """Process every image under input_dir and return aggregate throughput stats"""
+    files = find_images(config['input_dir'])
+    if not files:
+        raise ValueError(f'No images found in {config["input_dir"]}')
+    
+    manifest_path = config['manifest']
+    header = {'files': files, **{k: config[k] for k in ('operation', 'kernel', 'size', 'output_format')}}
+    header = json.loads(json.dumps(header))  # Same types as when read back (tuples become lists)
+    finished = None if restart else load_manifest(manifest_path, header)
+    
+    if config['output_format'] == 'npy':
+        shape = output_shape(config, len(files))
+        mode = 'r+' if finished is not None else 'w+'
+        stack = np.lib.format.open_memmap(config['output'], mode=mode, dtype=np.uint8, shape=shape if mode == 'w+' else None)
+    else:
+        os.makedirs(config['output'], exist_ok=True)
+        stack = None
+    
+    if finished is None:
+        finished = set()
+        with open(manifest_path, 'w') as f:
+            f.write(json.dumps(header) + '\n')
+    
+    tasks = [(i, rel_path, config) for i, rel_path in enumerate(files) if i not in finished]
+    print(f'📂 {len(files)} images found, {len(finished)} already done, {len(tasks)} to process')
+    
+    processed = errors = total_bytes = 0
+    start = time.perf_counter()
+    with open(manifest_path, 'a') as manifest, multiprocessing.Pool(workers) as pool:
+        for index, result, error, source_bytes, elapsed_ms in pool.imap_unordered(process_file, tasks, chunksize):
+            if error is None and stack is not None:
+                stack[index] = result
+            
+            entry = {'index': index, 'path': files[index], 'status': 'error' if error else 'ok', 'ms': round(elapsed_ms, 2)}
+            if error:
+                entry['error'] = error
+                errors += 1
+            manifest.write(json.dumps(entry) + '\n')
+            
+            processed += 1
+            total_bytes += source_bytes
+            if processed % 100 == 0:
+                # Make finished rows durable before recording them as done
+                if stack is not None:
+                    stack.flush()
+                manifest.flush()
+                rate = processed / (time.perf_counter() - start)
+                print(f'   {processed}/{len(tasks)} files ({rate:.1f} files/s)')
+        
+        if stack is not None:
+            stack.flush()
+    
+    elapsed = time.perf_counter() - start
+    return {
+        'processed': processed,
+        'errors': errors,
+        'skipped': len(finished),
+        'elapsed_s': elapsed,
+        'files_per_s': processed / elapsed if elapsed > 0 else 0,
+        'mb_per_s': total_bytes / 1048576 / elapsed if elapsed > 0 else 0,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Batch-process an image directory with the dashboard tools.')
+    parser.add_argument('input_dir', help='Directory to walk for images')
+    parser.add_argument('output', help='.npy stack path, or a directory when --output-format images')
+    parser.add_argument('--operation', choices=['normalize', 'filter'], default='normalize')
+    parser.add_argument('--kernel', default='0,0,0,0,1,0,0,0,0', help='9 comma-separated values for --operation filter')
+    parser.add_argument('--output-format', choices=['npy', 'images'], default='npy')
+    parser.add_argument('--size', default='256x256', help='WIDTHxHEIGHT every image is resized to (npy output); "none" keeps sizes for image output')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=16, help='Files handed to a worker at a time')
+    parser.add_argument('--manifest', help='Manifest path (default: OUTPUT.manifest.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing manifest and start over')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    size = None if args.size.lower() == 'none' else tuple(int(v) for v in args.size.lower().split('x'))
+    if size is None and args.output_format == 'npy':
+        print('❌ --size is required for npy output (all rows of the stack share one shape)')
+        return 1
+    
+    kernel = [float(v) for v in args.kernel.split(',')]
+    if len(kernel) != 9:
+        print('❌ --kernel needs exactly 9 values')
+        return 1
+    
+    config = {
+        'input_dir': args.input_dir,
+        'output': args.output,
+        'operation': args.operation,
+        'kernel': kernel,
+        'size': size,
+        'output_format': args.output_format,
+        'manifest': args.manifest or args.output.rstrip('/\\') + '.manifest.jsonl',
+    }
+    
+    try:
+        stats = run_batch(config, args.workers, args.chunksize, restart=args.restart)
+    except ValueError as e:
+        print(f'❌ {e}')
+        return 1
+    
+    print(f"✅ Processed {stats['processed']} files ({stats['errors']} errors, {stats['skipped']} skipped) "
+          f"in {stats['elapsed_s']:.1f}s: {stats['files_per_s']:.1f} files/s, {stats['mb_per_s']:.1f} MB/s")
+    print(f"📝 Per-file timings: {config['manifest']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,23 +5,32 @@ import numpy as np
 import io
 import base64
 import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 import google.genai as genai
 import openai
 import requests
 from urllib.parse import urlparse
+from image_decoder.image_decoder import decode_image
+from cnn_visualizer.feature_maps import compute_feature_maps
+from ai_providers.ai_providers import call_provider, CALL_TIMEOUT
+from http_cache.http_cache import cached_page
+from uploads.uploads import accepts_uploads, upload_digest, IMAGE_KINDS
 
 # Load environment variables
 load_dotenv()
 
 cnn_visualizer_bp = Blueprint('cnn_visualizer', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-
 # Configure AI APIs
 try:
     # Gemini for text descriptions
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'),
+                          http_options=genai.types.HttpOptions(timeout=int(CALL_TIMEOUT * 1000)))
     model = 'gemini-2.0-flash-exp'
 except Exception as e:
     print(f"Warning: Could not configure Gemini API: {e}")
@@ -31,13 +40,52 @@ except Exception as e:
 try:
     # OpenAI for image generation
     openai.api_key = os.getenv('OPENAI_API_KEY')
-    openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # No SDK retries: the provider guard's deadline covers the whole call
+    openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'), timeout=CALL_TIMEOUT, max_retries=0)
 except Exception as e:
     print(f"Warning: Could not configure OpenAI API: {e}")
     openai_client = None
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Per-block description cache, keyed by (image description hash, block number)
+BLOCK_CACHE_SIZE = 256
+_block_cache = OrderedDict()
+_block_cache_lock = threading.Lock()
+
+def _cache_key(image_description, block_number):
+    return hashlib.sha256(image_description.encode('utf-8')).hexdigest(), block_number
+
+def get_cached_block(image_description, block_number):
+    with _block_cache_lock:
+        key = _cache_key(image_description, block_number)
+        if key in _block_cache:
+            _block_cache.move_to_end(key)
+            return _block_cache[key]
+    return None
+
+def cache_block(image_description, block_number, text):
+    with _block_cache_lock:
+        _block_cache[_cache_key(image_description, block_number)] = text
+        _block_cache.move_to_end(_cache_key(image_description, block_number))
+        while len(_block_cache) > BLOCK_CACHE_SIZE:
+            _block_cache.popitem(last=False)
+
+# Gemini Vision analyses, keyed by the SHA-256 of the uploaded file
+ANALYSIS_CACHE_SIZE = 64
+_analysis_cache = OrderedDict()
+
+def get_cached_analysis(digest):
+    with _block_cache_lock:
+        if digest in _analysis_cache:
+            _analysis_cache.move_to_end(digest)
+            return _analysis_cache[digest]
+    return None
+
+def cache_analysis(digest, analysis):
+    with _block_cache_lock:
+        _analysis_cache[digest] = analysis
+        _analysis_cache.move_to_end(digest)
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
 
 def array_to_base64(image_array):
     """Convert numpy array to base64 string for display"""
@@ -137,6 +185,47 @@ def get_cnn_block_prompt(block_number, image_description):
     
     return prompts.get(block_number, "Invalid block number")
 
+BLOCK_FOCUS = {
+    1: "Edges & gradients: which edges, lines and gradients are highlighted, how the high-contrast edge-focused image looks, and what basic patterns emerge.",
+    2: "Patterns & textures: which patterns, textures, corners, curves and simple shapes are emphasized as edges combine over larger receptive fields.",
+    3: "Object parts: which meaningful object components (eyes, wheels, leaves, etc.) are highlighted and how recognizable structures emerge.",
+    4: "Complete objects: which complete objects are recognized and what high-level semantic features the largest receptive fields capture."
+}
+
+def get_all_blocks_prompt(image_description, block_numbers):
+    """Generate one prompt asking for several CNN block descriptions as JSON"""
+    block_lines = "\n".join(f'        - "block_{n}": {BLOCK_FOCUS[n]}' for n in block_numbers)
+    return f"""
+        You are an expert in Convolutional Neural Networks. I have an image: {image_description}
+        
+        Describe in detail how this image would look after passing through each of the following blocks of a CNN.
+        Keep each description vivid and technical but accessible.
+        
+        Respond with a single JSON object with exactly these keys, each mapped to a plain-text description:
+{block_lines}
+        """
+
+def parse_block_descriptions(response_text, block_numbers):
+    """Extract {block_number: text} from a JSON response, skipping blocks that are missing or empty"""
+    text = response_text.strip()
+    # Tolerate markdown code fences and chatter around the JSON object
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    blocks = {}
+    for n in block_numbers:
+        value = data.get(f'block_{n}', data.get(str(n)))
+        if isinstance(value, str) and value.strip():
+            blocks[n] = value.strip()
+    return blocks
+
 def get_image_generation_prompt(block_number, detailed_image_analysis):
     """Generate enhanced prompts for DALL-E image generation based on detailed image analysis"""
     
@@ -212,19 +301,68 @@ def get_image_generation_prompt(block_number, detailed_image_analysis):
     return prompts.get(block_number, "Invalid block number")
 
 def generate_cnn_visualization(image_description, block_number):
-    """Generate CNN visualization description using Gemini"""
+    """Generate CNN visualization description using Gemini; returns (text, error)"""
     if not client or not model:
-        return "Error: Gemini API not configured. Please check your API key."
+        return None, "Error: Gemini API not configured. Please check your API key."
+    
+    cached = get_cached_block(image_description, block_number)
+    if cached is not None:
+        return cached, None
     
     try:
         prompt = get_cnn_block_prompt(block_number, image_description)
-        response = client.models.generate_content(
+        response = call_provider('gemini', client.models.generate_content,
             model=model,
             contents=prompt
         )
-        return response.text
+        cache_block(image_description, block_number, response.text)
+        return response.text, None
     except Exception as e:
-        return f"Error generating visualization: {str(e)}"
+        return None, f"Error generating visualization: {str(e)}"
+
+def generate_all_cnn_visualizations(image_description):
+    """Generate all four block descriptions with one structured Gemini call.
+
+    Cached blocks are reused; any block missing from the JSON response falls
+    back to its own single-block request. Returns (blocks, errors), both keyed
+    by block number; a block is in exactly one of them.
+    """
+    if not client or not model:
+        return {}, {n: "Error: Gemini API not configured. Please check your API key." for n in range(1, 5)}
+    
+    blocks = {}
+    errors = {}
+    for n in range(1, 5):
+        cached = get_cached_block(image_description, n)
+        if cached is not None:
+            blocks[n] = cached
+    missing = [n for n in range(1, 5) if n not in blocks]
+    
+    if missing:
+        try:
+            response = call_provider('gemini', client.models.generate_content,
+                model=model,
+                contents=get_all_blocks_prompt(image_description, missing),
+                config={'response_mime_type': 'application/json'}
+            )
+        except Exception as e:
+            # Provider is failing; don't multiply the load with per-block retries
+            errors.update({n: f"Error generating visualization: {str(e)}" for n in missing})
+            return blocks, errors
+        
+        parsed = parse_block_descriptions(response.text, missing)
+        for n in missing:
+            if n in parsed:
+                cache_block(image_description, n, parsed[n])
+                blocks[n] = parsed[n]
+            else:
+                text, error = generate_cnn_visualization(image_description, n)
+                if error:
+                    errors[n] = error
+                else:
+                    blocks[n] = text
+    
+    return blocks, errors
 
 def generate_cnn_image(detailed_image_analysis, block_number):
     """Generate CNN visualization image using DALL-E based on detailed image analysis"""
@@ -234,7 +372,7 @@ def generate_cnn_image(detailed_image_analysis, block_number):
     try:
         prompt = get_image_generation_prompt(block_number, detailed_image_analysis)
         
-        response = openai_client.images.generate(
+        response = call_provider('openai', openai_client.images.generate,
             model="dall-e-3",
             prompt=prompt,
             size="1024x1024",
@@ -246,7 +384,7 @@ def generate_cnn_image(detailed_image_analysis, block_number):
         image_url = response.data[0].url
         
         # Download the image and convert to base64
-        img_response = requests.get(image_url)
+        img_response = requests.get(image_url, timeout=CALL_TIMEOUT)
         if img_response.status_code == 200:
             encoded_img = base64.b64encode(img_response.content).decode('utf-8')
             return f"data:image/png;base64,{encoded_img}", None
@@ -289,7 +427,7 @@ def analyze_image_with_gemini(image_path):
             }
         ]
         
-        response = client.models.generate_content(
+        response = call_provider('gemini', client.models.generate_content,
             model=model,
             contents=content
         )
@@ -311,10 +449,12 @@ def analyze_image_content(image):
         return f"Image analysis error: {str(e)}"
 
 @cnn_visualizer_bp.route('/')
+@cached_page
 def index():
     return render_template('cnn_visualizer/index.html')
 
 @cnn_visualizer_bp.route('/upload', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS)
 def upload_image():
     if 'file' not in request.files:
         flash('No file selected')
@@ -325,36 +465,31 @@ def upload_image():
         flash('No file selected')
         return redirect(url_for('cnn_visualizer.index'))
     
-    if not allowed_file(file.filename):
-        flash('Invalid file type. Please upload an image file.')
-        return redirect(url_for('cnn_visualizer.index'))
-    
     try:
-        # Process image
-        image = Image.open(file.stream)
-        
-        # Convert to RGB if needed
-        if image.mode not in ['RGB', 'L']:
-            image = image.convert('RGB')
-        
-        # Resize if too large (for better processing)
+        # Decode at reduced resolution, converting to RGB if needed
         max_size = (800, 800)
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Save image temporarily for Gemini Vision analysis
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            image.save(temp_file.name, format='JPEG')
-            temp_path = temp_file.name
-        
-        # Get detailed analysis using Gemini Vision
-        detailed_analysis, analysis_error = analyze_image_with_gemini(temp_path)
-        
-        # Clean up temp file
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
+        image, decode_stats = decode_image(file.stream, target_size=max_size, mode=('RGB', 'L'))
+        
+        # Re-uploads of the same file reuse the earlier analysis (the digest was computed while parsing)
+        digest = upload_digest(file)
+        detailed_analysis, analysis_error = get_cached_analysis(digest), None
+        if detailed_analysis is None:
+            # Save image temporarily for Gemini Vision analysis
+            import tempfile
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+                image.save(temp_file.name, format='JPEG')
+                temp_path = temp_file.name
+            
+            # Get detailed analysis using Gemini Vision
+            detailed_analysis, analysis_error = analyze_image_with_gemini(temp_path)
+            if not analysis_error:
+                cache_analysis(digest, detailed_analysis)
+            
+            # Clean up temp file
+            try:
+                os.unlink(temp_path)
+            except:
+                pass
         
         # Store detailed analysis in session for use in visualize_block
         session['detailed_image_analysis'] = detailed_analysis
@@ -370,9 +505,17 @@ def upload_image():
         image_array = np.array(image)
         image_b64 = array_to_base64(image_array)
         
+        # Run the local CNN so real feature maps are available without any API
+        local_blocks, local_time_ms = compute_feature_maps(image)
+        for block in local_blocks:
+            block['grid'] = array_to_base64(block['grid'])
+        
         return render_template('cnn_visualizer/visualize.html',
                              original_image=image_b64,
                              image_description=image_description,
+                             local_blocks=local_blocks,
+                             local_time_ms=local_time_ms,
+                             decode_stats=decode_stats,
                              filename=secure_filename(file.filename))
     
     except Exception as e:
@@ -392,12 +535,15 @@ def visualize_block():
             return jsonify({'error': 'Invalid block number'}), 400
         
         # Generate text visualization description
-        visualization_text = generate_cnn_visualization(image_description, block_number)
+        visualization_text, visualization_error = generate_cnn_visualization(image_description, block_number)
         
+        # Provider failures stay a 200 so the page can show them in place; the
+        # *_error fields let API clients tell them apart from real descriptions
         result = {
             'success': True,
             'block_number': block_number,
-            'visualization': visualization_text,
+            'visualization': visualization_text or visualization_error,
+            'visualization_error': visualization_error,
             'generated_image': None,
             'image_error': None
         }
@@ -414,3 +560,21 @@ def visualize_block():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@cnn_visualizer_bp.route('/visualize_all', methods=['POST'])
+def visualize_all():
+    """Generate all four CNN block descriptions in one request via AJAX"""
+    try:
+        data = request.get_json()
+        image_description = data.get('image_description', 'An uploaded image')
+        
+        blocks, errors = generate_all_cnn_visualizations(image_description)
+        
+        return jsonify({
+            'success': True,
+            'visualizations': {str(n): blocks.get(n) or errors[n] for n in range(1, 5)},
+            'errors': {str(n): error for n, error in errors.items()}
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,127 @@
+from PIL import Image
+import numpy as np
+import time
+
+# Input is resized so its longest side is at most this many pixels
+INPUT_SIZE = 256
+FILTERS_PER_BLOCK = 8
+NUM_BLOCKS = 4
+# Each block halves the resolution, so smaller inputs would pool away to nothing
+MIN_INPUT_SIZE = 2 ** NUM_BLOCKS
+
+BLOCK_NAMES = {
+    1: 'Edges & Gradients',
+    2: 'Patterns & Textures',
+    3: 'Object Parts',
+    4: 'Complete Objects',
+}
+
+def _edge_filter_bank():
+    """Hand-crafted first-block filters: oriented edges, a Laplacian and a blob detector"""
+    sobel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]], dtype=np.float32)
+    diagonal = np.array([[0, 1, 2], [-1, 0, 1], [-2, -1, 0]], dtype=np.float32)
+    laplacian = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], dtype=np.float32)
+    filters = [
+        sobel_x, -sobel_x,
+        sobel_x.T, -sobel_x.T,
+        diagonal, -diagonal,
+        laplacian, -laplacian,
+    ]
+    return np.stack(filters)[:, np.newaxis] / 4.0
+
+def _build_weights(seed=0):
+    """Build the fixed weights for every block as (out, in, 3, 3) arrays"""
+    rng = np.random.default_rng(seed)
+    weights = [_edge_filter_bank()]
+    for _ in range(NUM_BLOCKS - 1):
+        w = rng.standard_normal((FILTERS_PER_BLOCK, FILTERS_PER_BLOCK, 3, 3)).astype(np.float32)
+        # Zero-mean filters respond to structure rather than overall brightness
+        w -= w.mean(axis=(1, 2, 3), keepdims=True)
+        w /= np.sqrt((w ** 2).sum(axis=(1, 2, 3), keepdims=True))
+        weights.append(w)
+    return weights
+
+WEIGHTS = _build_weights()
+
+def conv2d(x, w):
+    """3x3 same-padding convolution of a (C, H, W) tensor using im2col and one matmul"""
+    channels, height, width = x.shape
+    out_channels, _, k, _ = w.shape
+    pad = k // 2
+
+    padded = np.pad(x, ((0, 0), (pad, pad), (pad, pad)), mode='edge')
+    # (C, H, W, k, k) view without copying, then one gather into the column matrix
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (k, k), axis=(1, 2))
+    columns = windows.transpose(1, 2, 0, 3, 4).reshape(height * width, channels * k * k)
+
+    output = columns @ w.reshape(out_channels, -1).T
+    return output.T.reshape(out_channels, height, width)
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+def max_pool(x, size=2):
+    """Non-overlapping max pooling over the spatial axes"""
+    channels, height, width = x.shape
+    height, width = height // size * size, width // size * size
+    x = x[:, :height, :width]
+    return x.reshape(channels, height // size, size, width // size, size).max(axis=(2, 4))
+
+def prepare_input(image):
+    """Convert a PIL image to a (1, H, W) float32 tensor in [0, 1].
+
+    Tiny or very thin images are edge-padded to MIN_INPUT_SIZE per side, so
+    every block still has at least one pixel left after pooling.
+    """
+    image = image.convert('L')
+    image.thumbnail((INPUT_SIZE, INPUT_SIZE), Image.Resampling.BILINEAR)
+    x = np.asarray(image, dtype=np.float32) / 255.0
+    pad_h, pad_w = max(0, MIN_INPUT_SIZE - x.shape[0]), max(0, MIN_INPUT_SIZE - x.shape[1])
+    if pad_h or pad_w:
+        x = np.pad(x, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2)), mode='edge')
+    return x[np.newaxis]
+
+def run_network(x):
+    """Run all blocks and return the activation tensor after each one"""
+    activations = []
+    for w in WEIGHTS:
+        x = max_pool(relu(conv2d(x, w)))
+        # Rescale so deeper blocks stay in a similar numeric range
+        peak = x.max()
+        if peak > 0:
+            x /= peak
+        activations.append(x)
+    return activations
+
+def feature_map_grid(activation, columns=4, gap=2):
+    """Tile every channel of a (C, H, W) activation into one uint8 grid image"""
+    channels, height, width = activation.shape
+    rows = int(np.ceil(channels / columns))
+
+    # Stretch each map to 0-255 independently so weak channels stay visible
+    lo = activation.min(axis=(1, 2), keepdims=True)
+    hi = activation.max(axis=(1, 2), keepdims=True)
+    scaled = (activation - lo) / np.where(hi - lo > 0, hi - lo, 1) * 255
+
+    grid = np.full((rows * (height + gap) - gap, columns * (width + gap) - gap), 255, dtype=np.uint8)
+    for idx in range(channels):
+        r, c = divmod(idx, columns)
+        top, left = r * (height + gap), c * (width + gap)
+        grid[top:top + height, left:left + width] = scaled[idx]
+    return grid
+
+def compute_feature_maps(image):
+    """Run the local CNN over a PIL image and return per-block feature-map grids"""
+    start = time.perf_counter()
+    activations = run_network(prepare_input(image))
+
+    blocks = []
+    for block_number, activation in enumerate(activations, start=1):
+        blocks.append({
+            'block_number': block_number,
+            'name': BLOCK_NAMES[block_number],
+            'shape': activation.shape,
+            'grid': feature_map_grid(activation),
+        })
+
+    return blocks, (time.perf_counter() - start) * 1000
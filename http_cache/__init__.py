@@ -0,0 +1 @@
+# HTTP Cache Package
@@ -0,0 +1,100 @@
+from flask import current_app, make_response, request, session
+from functools import wraps
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth the compression overhead
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv',
+    'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml',
+}
+
+_page_cache = {}
+_page_cache_lock = threading.Lock()
+
+def body_digest(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def choose_encoding(response, size):
+    """Pick the best content encoding the client accepts, or None to send as-is"""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or size < COMPRESSION_MIN_SIZE:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def finalize_response(response):
+    """after_request hook: ETag + conditional GET, then compress large text bodies.
+
+    Streamed and file responses are left alone (send_file already handles its
+    own validators). The ETag is taken over the uncompressed body and tagged
+    with the encoding, so each variant has its own validator.
+    """
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+
+    body = response.get_data()
+    encoding = choose_encoding(response, len(body))
+    if response.mimetype in COMPRESSIBLE_MIMETYPES:
+        response.vary.add('Accept-Encoding')
+
+    if request.method in ('GET', 'HEAD'):
+        etag = response.get_etag()[0] or body_digest(body)
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def cached_page(view):
+    """Cache the rendered HTML of a page whose output never depends on the request.
+
+    Pages are rendered once per path and then served from memory with a
+    precomputed ETag. The cache is bypassed while flash messages are pending
+    (base.html shows them) and in debug mode, where templates reload on change.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.debug or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = request.path
+        with _page_cache_lock:
+            cached = _page_cache.get(key)
+        if cached is None:
+            html = view(*args, **kwargs)
+            cached = (html, body_digest(html.encode('utf-8')))
+            with _page_cache_lock:
+                _page_cache[key] = cached
+
+        html, etag = cached
+        response = make_response(html)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'  # Always revalidate; the ETag makes that a 304
+        return response
+    return wrapper
@@ -0,0 +1 @@
+# Image Decoder Package
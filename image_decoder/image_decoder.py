@@ -0,0 +1,268 @@
+from flask import current_app, has_app_context
+from PIL import Image, ImageSequence, UnidentifiedImageError
+import numpy as np
+import io
+import os
+import time
+
+NPY_MAGIC = b'\x93NUMPY'
+
+# Frame volumes are processed this many pixels at a time so the float32 working set stays in cache
+FRAME_BLOCK_PIXELS = 1 << 18
+
+# 16-bit, 32-bit integer and float modes (e.g. scientific TIFFs) are stretched to 8-bit on decode
+HIGH_BIT_DEPTH_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N', 'I', 'F')
+
+# Default pixel budget for a single decoded image (in megapixels)
+DEFAULT_MAX_MEGAPIXELS = float(os.getenv('MAX_DECODE_MEGAPIXELS', '50'))
+
+def get_megapixel_budget():
+    """Return the configured megapixel budget for decoding"""
+    if has_app_context():
+        return current_app.config.get('MAX_DECODE_MEGAPIXELS', DEFAULT_MAX_MEGAPIXELS)
+    return DEFAULT_MAX_MEGAPIXELS
+
+def rescale_to_8bit(image, value_range):
+    """Linearly stretch a high-bit-depth image over value_range=(low, high) to an 8-bit 'L' image"""
+    low, high = value_range
+    values = np.asarray(image, dtype=np.float32)
+    scale = 255 / (high - low) if high > low else 0
+    return Image.fromarray(np.clip(np.rint((values - low) * scale), 0, 255).astype(np.uint8))
+
+def decode_image(stream, target_size=None, mode=None, max_megapixels=None):
+    """Decode an uploaded image, downscaling at decode time when a target size is known.
+
+    `mode` may be a single mode or a tuple of acceptable modes; images in any
+    other mode are converted to the first one. Returns the PIL image and a dict
+    of decode statistics. Raises ValueError if the image would exceed the
+    megapixel budget once decoded.
+    """
+    if isinstance(mode, str):
+        mode = (mode,)
+    if max_megapixels is None:
+        max_megapixels = get_megapixel_budget()
+
+    start = time.perf_counter()
+
+    # Only the header is read here; pixel data is not allocated yet
+    try:
+        image = Image.open(stream)
+    except UnidentifiedImageError:
+        raise ValueError('Unrecognised image format.')
+    source_size = image.size
+
+    # Let the decoder skip detail we are going to throw away (JPEG DCT scaling)
+    draft_applied = False
+    if target_size is not None:
+        draft_mode = mode[0] if mode and mode[0] in ('RGB', 'L') else None
+        draft_applied = image.draft(draft_mode, target_size) is not None
+
+    width, height = image.size
+    megapixels = (width * height) / 1_000_000
+    if max_megapixels and megapixels > max_megapixels:
+        # The budget applies to the size actually decoded, which a draft may have reduced
+        reduced = f' even when reduced from {source_size[0]}x{source_size[1]}' if image.size != source_size else ''
+        raise ValueError(
+            f'Image is {width}x{height} ({megapixels:.1f} MP){reduced}, '
+            f'which exceeds the {max_megapixels:g} MP limit.'
+        )
+
+    image.load()
+    memory_bytes = width * height * len(image.getbands())
+
+    if image.mode in HIGH_BIT_DEPTH_MODES:
+        image = rescale_to_8bit(image, image.getextrema())
+
+    if mode and image.mode not in mode:
+        image = image.convert(mode[0])
+
+    if target_size is not None:
+        image.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+    decode_stats = {
+        'source_size': source_size,
+        'decoded_size': image.size,
+        'megapixels': megapixels,
+        'draft_applied': draft_applied,
+        'decode_time_ms': (time.perf_counter() - start) * 1000,
+        'memory_bytes': memory_bytes,
+    }
+    return image, decode_stats
+
+def decode_image_array(stream, target_size=None, mode=None, max_megapixels=None):
+    """Decode an uploaded image straight to a numpy array"""
+    image, decode_stats = decode_image(stream, target_size, mode, max_megapixels)
+    return np.array(image), decode_stats
+
+def is_animated(stream):
+    """True if the stream holds a multi-frame image (animated GIF, TIFF stack, ...)"""
+    try:
+        image = Image.open(stream)
+        return getattr(image, 'n_frames', 1) > 1
+    except UnidentifiedImageError:
+        return False
+    finally:
+        stream.seek(0)
+
+def decode_frames(stream, mode=None, max_megapixels=None):
+    """Decode every frame of a multi-frame image into one (frames, H, W[, C]) uint8 array.
+
+    The megapixel budget applies to all frames together. Returns the array, the
+    per-frame durations in milliseconds (for re-encoding) and decode statistics.
+    """
+    if isinstance(mode, str):
+        mode = (mode,)
+    if max_megapixels is None:
+        max_megapixels = get_megapixel_budget()
+
+    start = time.perf_counter()
+    try:
+        image = Image.open(stream)
+    except UnidentifiedImageError:
+        raise ValueError('Unrecognised image format.')
+
+    width, height = image.size
+    num_frames = getattr(image, 'n_frames', 1)
+    megapixels = (width * height * num_frames) / 1_000_000
+    if max_megapixels and megapixels > max_megapixels:
+        raise ValueError(
+            f'Image has {num_frames} frames of {width}x{height} ({megapixels:.1f} MP in total), '
+            f'which exceeds the {max_megapixels:g} MP limit.'
+        )
+
+    # Palette frames are converted to RGB; every frame shares the first frame's mode
+    source_mode = 'L' if image.mode in HIGH_BIT_DEPTH_MODES else image.mode
+    frame_mode = source_mode if mode and source_mode in mode else (mode[0] if mode else 'RGB')
+    if frame_mode not in ('RGB', 'L'):
+        frame_mode = 'RGB'
+
+    # One range for the whole stack, so high-bit-depth frames stay comparable after stretching
+    value_range = None
+    if image.mode in HIGH_BIT_DEPTH_MODES:
+        extrema = [frame.getextrema() for frame in ImageSequence.Iterator(image)]
+        value_range = (min(low for low, _ in extrema), max(high for _, high in extrema))
+
+    channels = () if frame_mode == 'L' else (3,)
+    frames = np.empty((num_frames, height, width) + channels, dtype=np.uint8)
+    durations = []
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if frame.size != (width, height):
+            raise ValueError(f'Frame {index + 1} is {frame.size[0]}x{frame.size[1]}; all frames must be {width}x{height}.')
+        if frame.mode in HIGH_BIT_DEPTH_MODES:
+            frame = rescale_to_8bit(frame, value_range or frame.getextrema())
+        frames[index] = np.asarray(frame.convert(frame_mode))
+        durations.append(frame.info.get('duration', 100))
+
+    decode_stats = {
+        'source_size': (width, height),
+        'decoded_size': (width, height),
+        'frames': num_frames,
+        'megapixels': megapixels,
+        'draft_applied': False,
+        'decode_time_ms': (time.perf_counter() - start) * 1000,
+        'memory_bytes': frames.nbytes,
+    }
+    return frames, durations, decode_stats
+
+def frame_blocks(frames):
+    """Yield slices over the frame axis covering about FRAME_BLOCK_PIXELS pixels each.
+
+    Small frames are batched many to a block; frames larger than the block size
+    get a block of their own.
+    """
+    frame_pixels = frames.shape[1] * frames.shape[2]
+    step = max(1, FRAME_BLOCK_PIXELS // frame_pixels)
+    for start in range(0, len(frames), step):
+        yield slice(start, start + step)
+
+def frames_to_gif_bytes(frames, durations):
+    """Encode a (frames, H, W[, C]) uint8 array as a looping animated GIF"""
+    images = [Image.fromarray(frame) for frame in frames]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format='GIF', save_all=True, append_images=images[1:],
+                   duration=durations, loop=0)
+    return buffer.getvalue()
+
+def pyramid_level(image_array, max_side):
+    """Halve an image with 2x2 averaging until its longest side is at most max_side.
+
+    Returns the reduced float32 array and the total downscale factor (1 if the
+    image was already small enough).
+    """
+    level = image_array.astype(np.float32)
+    factor = 1
+    while max(level.shape[:2]) > max_side:
+        height, width = level.shape[0] // 2 * 2, level.shape[1] // 2 * 2
+        level = level[:height, :width]
+        level = (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) * 0.25
+        factor *= 2
+    return level, factor
+
+def decode_array_body(stream, mode=None, max_megapixels=None):
+    """Decode a raw request body (a seekable file) holding either an encoded image or a .npy array"""
+    head = stream.read(len(NPY_MAGIC))
+    stream.seek(0)
+    if not head:
+        raise ValueError('Request body is empty.')
+    
+    if head != NPY_MAGIC:
+        return decode_image_array(stream, mode=mode, max_megapixels=max_megapixels)
+    
+    if max_megapixels is None:
+        max_megapixels = get_megapixel_budget()
+    
+    start = time.perf_counter()
+    
+    # Check shape, dtype and size from the header before anything is allocated
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, _, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f'Unsupported .npy format version {version[0]}.{version[1]}.')
+    if len(shape) not in (2, 3) or (len(shape) == 3 and shape[2] not in (1, 3, 4)):
+        raise ValueError(f'Array must have shape (H, W) or (H, W, C), got {shape}.')
+    if not np.issubdtype(dtype, np.number):
+        raise ValueError(f'Array must be numeric, got {dtype}.')
+    
+    height, width = shape[:2]
+    megapixels = (width * height) / 1_000_000
+    if max_megapixels and megapixels > max_megapixels:
+        raise ValueError(f'Array is {width}x{height} ({megapixels:.1f} MP), which exceeds the {max_megapixels:g} MP limit.')
+    
+    stream.seek(0)
+    image_array = np.load(stream, allow_pickle=False)
+    
+    if image_array.ndim == 3 and image_array.shape[2] == 1:
+        image_array = image_array[..., 0]
+    
+    decode_stats = {
+        'source_size': (width, height),
+        'decoded_size': (width, height),
+        'megapixels': megapixels,
+        'draft_applied': False,
+        'decode_time_ms': (time.perf_counter() - start) * 1000,
+        'memory_bytes': image_array.nbytes,
+    }
+    return image_array, decode_stats
+
+def array_to_npy_bytes(image_array):
+    """Serialise an array to .npy bytes"""
+    buffer = io.BytesIO()
+    np.save(buffer, image_array, allow_pickle=False)
+    return buffer.getvalue()
+
+def array_to_png_bytes(image_array):
+    """Encode a uint8 grayscale or RGB array as PNG bytes"""
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def encode_array(image_array, output_format):
+    """Encode an array for a machine-facing response; returns (bytes, mimetype)"""
+    if output_format == 'npy':
+        return array_to_npy_bytes(image_array), 'application/octet-stream'
+    if output_format == 'png':
+        return array_to_png_bytes(image_array), 'image/png'
+    raise ValueError(f'Unsupported output format {output_format!r}; use npy or png.')
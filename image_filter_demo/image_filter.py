@@ -1,42 +1,180 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file
+from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file, jsonify, Response
 from werkzeug.utils import secure_filename
 from PIL import Image
 import numpy as np
 import os
 import io
 import base64
+import json
+import time
+from image_decoder.image_decoder import decode_image_array, decode_array_body, encode_array, pyramid_level, is_animated, decode_frames, frames_to_gif_bytes, frame_blocks
+from background_jobs.background_jobs import submit_job, get_job, job_status, JobQueueFull
+from image_normalizer.image_normalizer import normalize_float
+from http_cache.http_cache import cached_page
+from uploads.uploads import accepts_uploads, spooled_body, IMAGE_KINDS
 
 image_filter_bp = Blueprint('image_filter', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+PIPELINE_OPS = {'kernel', 'grayscale', 'normalize'}
+MAX_KERNEL_SIZE = 15
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Images with a longer side than this get a preview first and the full result later
+PROGRESSIVE_MIN_SIDE = 1024
+PREVIEW_MAX_SIDE = 512
+
+def to_grayscale(image_array, frames=False):
+    """Convert an RGB(A) array to float32 luminance; grayscale input is just cast.
+
+    With `frames=True` the array has a leading frame axis, (frames, H, W[, C]).
+    """
+    if image_array.ndim == (4 if frames else 3):
+        return np.dot(image_array[..., :3], np.array([0.2989, 0.5870, 0.1140], dtype=np.float32))
+    return image_array.astype(np.float32)
+
+def convolve_float(image_array, kernel):
+    """Correlate a 2D or (H, W, C) float image with a kernel, with edge padding and no clipping"""
+    kernel_h, kernel_w = kernel.shape
+    pad_h, pad_w = kernel_h // 2, kernel_w // 2
+    height, width = image_array.shape[:2]
+    
+    pad_width = ((pad_h, pad_h), (pad_w, pad_w)) + ((0, 0),) * (image_array.ndim - 2)
+    padded_image = np.pad(image_array.astype(np.float32, copy=False), pad_width, mode='edge')
+    
+    # One shifted multiply-add per kernel tap instead of a Python loop per pixel
+    output = np.zeros(image_array.shape, dtype=np.float32)
+    for u in range(kernel_h):
+        for v in range(kernel_w):
+            if kernel[u, v] != 0:
+                output += np.float32(kernel[u, v]) * padded_image[u:u + height, v:v + width]
+    return output
 
 def apply_convolution(image_array, kernel):
     """Apply convolution with the given kernel to the image"""
     # Convert to grayscale if needed
-    if len(image_array.shape) == 3:
-        image_array = np.dot(image_array[...,:3], [0.2989, 0.5870, 0.1140])
+    output = convolve_float(to_grayscale(image_array), kernel)
     
-    height, width = image_array.shape
-    kernel_size = kernel.shape[0]
-    pad = kernel_size // 2
+    # Normalize output to 0-255 range
+    output = np.clip(output, 0, 255)
+    return output.astype(np.uint8)
+
+def apply_convolution_frames(frames, kernel):
+    """Filter every frame of a (frames, H, W[, C]) volume, many frames per vectorized op"""
+    kernel_h, kernel_w = kernel.shape
+    pad_h, pad_w = kernel_h // 2, kernel_w // 2
+    height, width = frames.shape[1:3]
+    result = np.empty(frames.shape[:3], dtype=np.uint8)
     
-    # Pad the image
-    padded_image = np.pad(image_array, ((pad, pad), (pad, pad)), mode='edge')
+    for block in frame_blocks(frames):
+        volume = to_grayscale(frames[block], frames=True)
+        padded = np.pad(volume, ((0, 0), (pad_h, pad_h), (pad_w, pad_w)), mode='edge')
+        
+        # Same per-tap multiply-add as convolve_float, with each tap covering the whole block
+        output = np.zeros(volume.shape, dtype=np.float32)
+        scratch = np.empty_like(output)
+        for u in range(kernel_h):
+            for v in range(kernel_w):
+                if kernel[u, v] != 0:
+                    np.multiply(padded[:, u:u + height, v:v + width], np.float32(kernel[u, v]), out=scratch)
+                    output += scratch
+        
+        np.clip(output, 0, 255, out=output)
+        result[block] = output
+    return result
+
+def fold_kernels(first, second):
+    """Combine two kernels applied one after the other into a single equivalent kernel"""
+    first_h, first_w = first.shape
+    second_h, second_w = second.shape
+    combined = np.zeros((first_h + second_h - 1, first_w + second_w - 1), dtype=np.float64)
+    for u in range(second_h):
+        for v in range(second_w):
+            combined[u:u + first_h, v:v + first_w] += second[u, v] * first
+    return combined
+
+def parse_pipeline(raw_steps):
+    """Validate a list of pipeline steps (parsed from JSON) into (op, kernel) tuples"""
+    if not isinstance(raw_steps, list) or not raw_steps:
+        raise ValueError('Pipeline must be a non-empty list of steps.')
     
-    # Apply convolution
-    output = np.zeros_like(image_array)
+    steps = []
+    for position, step in enumerate(raw_steps, start=1):
+        op = step.get('op') if isinstance(step, dict) else None
+        if op not in PIPELINE_OPS:
+            raise ValueError(f'Step {position}: unknown operation {op!r}.')
+        
+        kernel = None
+        if op == 'kernel':
+            kernel = np.array(step.get('kernel'), dtype=np.float64)
+            if kernel.ndim != 2 or kernel.shape[0] % 2 == 0 or kernel.shape[1] % 2 == 0:
+                raise ValueError(f'Step {position}: kernel must be a 2D list with odd dimensions.')
+            if max(kernel.shape) > MAX_KERNEL_SIZE:
+                raise ValueError(f'Step {position}: kernel is {kernel.shape[0]}x{kernel.shape[1]}; '
+                                 f'at most {MAX_KERNEL_SIZE}x{MAX_KERNEL_SIZE} is allowed.')
+        steps.append((op, kernel))
+    return steps
+
+def compile_pipeline(steps):
+    """Fold runs of consecutive kernels into one combined kernel where it stays small.
+
+    Returns (op, kernel, parts) tuples; `parts` lists the original kernels a
+    combined kernel was folded from, in order (see convolve_fused).
+    """
+    compiled = []
+    for op, kernel in steps:
+        if op == 'kernel' and compiled and compiled[-1][0] == 'kernel':
+            combined = fold_kernels(compiled[-1][1], kernel)
+            if max(combined.shape) <= MAX_KERNEL_SIZE:
+                compiled[-1] = ('kernel', combined, compiled[-1][2] + [kernel])
+                continue
+        compiled.append((op, kernel, [kernel] if op == 'kernel' else None))
+    return compiled
+
+def convolve_fused(image_array, kernel, parts):
+    """Apply the kernels in `parts` one after the other, using their folded `kernel`.
+
+    The folded kernel matches step-by-step application wherever no step reaches
+    the edge padding, i.e. outside a band of the combined radius. That band is
+    redone by running the steps in order on strips twice the radius deep, whose
+    own cut edge can only disturb rows/columns beyond the band.
+    """
+    if len(parts) == 1:
+        return convolve_float(image_array, kernel)
     
-    for i in range(height):
-        for j in range(width):
-            region = padded_image[i:i+kernel_size, j:j+kernel_size]
-            output[i, j] = np.sum(region * kernel)
+    def step_by_step(region):
+        for part in parts:
+            region = convolve_float(region, part)
+        return region
     
-    # Normalize output to 0-255 range
-    output = np.clip(output, 0, 255)
-    return output.astype(np.uint8)
+    radius_h, radius_w = kernel.shape[0] // 2, kernel.shape[1] // 2
+    height, width = image_array.shape[:2]
+    if height <= 2 * radius_h or width <= 2 * radius_w:
+        return step_by_step(image_array)
+    
+    output = convolve_float(image_array, kernel)
+    if radius_h:
+        output[:radius_h] = step_by_step(image_array[:2 * radius_h])[:radius_h]
+        output[-radius_h:] = step_by_step(image_array[-2 * radius_h:])[-radius_h:]
+    if radius_w:
+        output[:, :radius_w] = step_by_step(image_array[:, :2 * radius_w])[:, :radius_w]
+        output[:, -radius_w:] = step_by_step(image_array[:, -2 * radius_w:])[:, -radius_w:]
+    return output
+
+def run_pipeline(image_array, steps):
+    """Run a compiled pipeline in float32 and return the final uint8 image"""
+    output = image_array.astype(np.float32)
+    if output.ndim == 3:
+        output = output[..., :3]
+    
+    for op, kernel, parts in steps:
+        if op == 'kernel':
+            output = convolve_fused(output, kernel, parts)
+        elif op == 'grayscale':
+            output = to_grayscale(output)
+        elif op == 'normalize':
+            output, _ = normalize_float(output)
+    
+    # Clip and cast once, at the very end
+    return np.clip(output, 0, 255).astype(np.uint8)
 
 def array_to_base64(image_array):
     """Convert numpy array to base64 string for display"""
@@ -54,11 +192,47 @@ def array_to_base64(image_array):
     encoded_img = base64.b64encode(buffer.read()).decode('utf-8')
     return f"data:image/png;base64,{encoded_img}"
 
+def frames_to_base64(frames, durations):
+    """Encode a frame volume as an animated GIF data URI for display"""
+    encoded_img = base64.b64encode(frames_to_gif_bytes(frames, durations)).decode('utf-8')
+    return f"data:image/gif;base64,{encoded_img}"
+
+def parse_kernel(values):
+    """Build a 3x3 kernel from 9 values, treating anything non-numeric as 0"""
+    kernel_values = []
+    for value in values:
+        try:
+            kernel_values.append(float(value))
+        except (TypeError, ValueError):
+            kernel_values.append(0.0)
+    
+    if len(kernel_values) != 9:
+        raise ValueError('Kernel must have exactly 9 values.')
+    return np.array(kernel_values).reshape(3, 3)
+
+def to_display_array(image_array):
+    """Round a float preview level back to uint8 for encoding"""
+    return np.clip(np.rint(image_array), 0, 255).astype(np.uint8)
+
+def filter_full_resolution(image_array, kernel):
+    """Background job: filter and encode the full-resolution image"""
+    return {
+        'original_image': array_to_base64(image_array),
+        'filtered_image': array_to_base64(apply_convolution(image_array, kernel)),
+    }
+
+def refilter_upload(upload, kernel):
+    """Background job: decode the kept upload again and filter it at full resolution"""
+    image_array, _ = decode_image_array(io.BytesIO(upload))
+    return filter_full_resolution(image_array, kernel)
+
 @image_filter_bp.route('/')
+@cached_page
 def index():
     return render_template('image_filter/index.html')
 
 @image_filter_bp.route('/upload', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS)
 def upload_and_filter():
     if 'file' not in request.files:
         flash('No file selected')
@@ -69,25 +243,46 @@ def upload_and_filter():
         flash('No file selected')
         return redirect(url_for('image_filter.index'))
     
-    if not allowed_file(file.filename):
-        flash('Invalid file type. Please upload an image file.')
-        return redirect(url_for('image_filter.index'))
-    
     try:
         # Get kernel values from form
-        kernel_values = []
-        for i in range(9):  # 3x3 kernel
-            value = request.form.get(f'kernel_{i}', '0')
-            try:
-                kernel_values.append(float(value))
-            except ValueError:
-                kernel_values.append(0.0)
+        kernel = parse_kernel(request.form.get(f'kernel_{i}', '0') for i in range(9))
         
-        kernel = np.array(kernel_values).reshape(3, 3)
+        # Animated GIF / TIFF stack: filter all frames at once and send back an animation
+        if is_animated(file.stream):
+            frames, durations, decode_stats = decode_frames(file.stream, mode=('RGB', 'L'))
+            filtered_frames = apply_convolution_frames(frames, kernel)
+            
+            return render_template('image_filter/result.html', 
+                                 original_image=frames_to_base64(frames, durations),
+                                 filtered_image=frames_to_base64(filtered_frames, durations),
+                                 kernel=kernel.tolist(),
+                                 decode_stats=decode_stats,
+                                 filename=secure_filename(file.filename))
         
         # Process image
-        image = Image.open(file.stream)
-        image_array = np.array(image)
+        image_array, decode_stats = decode_image_array(file.stream)
+        
+        # Large image: answer with a preview level now, finish full resolution in the background.
+        # The job keeps the encoded upload for refines, not the decoded array.
+        job_id = None
+        if max(image_array.shape[:2]) > PROGRESSIVE_MIN_SIDE:
+            preview_source, scale = pyramid_level(image_array, PREVIEW_MAX_SIDE)
+            file.stream.seek(0)
+            try:
+                job_id = submit_job(filter_full_resolution, image_array, kernel,
+                                    data={'upload': file.stream.read(), 'preview_source': preview_source})
+            except JobQueueFull:
+                pass  # Job store is full: filter at full resolution in this request instead
+        
+        if job_id:
+            return render_template('image_filter/result.html', 
+                                 original_image=array_to_base64(to_display_array(preview_source)),
+                                 filtered_image=array_to_base64(apply_convolution(preview_source, kernel)),
+                                 kernel=kernel.tolist(),
+                                 job_id=job_id,
+                                 preview_scale=scale,
+                                 decode_stats=decode_stats,
+                                 filename=secure_filename(file.filename))
         
         # Apply convolution
         filtered_array = apply_convolution(image_array, kernel)
@@ -100,8 +295,118 @@ def upload_and_filter():
                              original_image=original_b64,
                              filtered_image=filtered_b64,
                              kernel=kernel.tolist(),
+                             decode_stats=decode_stats,
                              filename=secure_filename(file.filename))
     
     except Exception as e:
         flash(f'Error processing image: {str(e)}')
         return redirect(url_for('image_filter.index'))
+
+@image_filter_bp.route('/pipeline', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS)
+def upload_and_run_pipeline():
+    if 'file' not in request.files:
+        flash('No file selected')
+        return redirect(url_for('image_filter.index'))
+    
+    file = request.files['file']
+    if file.filename == '':
+        flash('No file selected')
+        return redirect(url_for('image_filter.index'))
+    
+    try:
+        # Parse the ordered list of operations
+        try:
+            raw_steps = json.loads(request.form.get('pipeline', ''))
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Pipeline is not valid JSON: {e}')
+        steps = parse_pipeline(raw_steps)
+        compiled_steps = compile_pipeline(steps)
+        
+        # Process image
+        image_array, decode_stats = decode_image_array(file.stream, mode=('RGB', 'L'))
+        filtered_array = run_pipeline(image_array, compiled_steps)
+        
+        # Convert to base64 for display
+        original_b64 = array_to_base64(image_array)
+        filtered_b64 = array_to_base64(filtered_array)
+        
+        return render_template('image_filter/result.html', 
+                             original_image=original_b64,
+                             filtered_image=filtered_b64,
+                             pipeline_steps=steps,
+                             compiled_steps=compiled_steps,
+                             decode_stats=decode_stats,
+                             filename=secure_filename(file.filename))
+    
+    except Exception as e:
+        flash(f'Error processing image: {str(e)}')
+        return redirect(url_for('image_filter.index'))
+
+@image_filter_bp.route('/result/<job_id>')
+def full_result(job_id):
+    """Poll for the full-resolution result of a progressive upload"""
+    status = job_status(job_id)
+    return jsonify(status), 404 if status['status'] == 'missing' else 200
+
+@image_filter_bp.route('/preview/<job_id>', methods=['POST'])
+def preview_kernel(job_id):
+    """Re-filter the stored preview level with a new kernel via AJAX"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    try:
+        start = time.perf_counter()
+        kernel = parse_kernel(request.get_json().get('kernel', []))
+        filtered_b64 = array_to_base64(apply_convolution(job['data']['preview_source'], kernel))
+        return jsonify({
+            'success': True,
+            'filtered_image': filtered_b64,
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@image_filter_bp.route('/refine/<job_id>', methods=['POST'])
+def refine_kernel(job_id):
+    """Start a new full-resolution job on the stored image with a new kernel"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    try:
+        kernel = parse_kernel(request.get_json().get('kernel', []))
+        new_job_id = submit_job(refilter_upload, job['data']['upload'], kernel, data=job['data'])
+        return jsonify({'success': True, 'job_id': new_job_id})
+    except JobQueueFull as e:
+        return jsonify({'error': f'{e}, please try again shortly'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@image_filter_bp.route('/api/filter', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS, 'npy')
+def api_filter():
+    """Filter a raw image or .npy request body and return .npy or PNG bytes.
+
+    Query parameters: `kernel` (9 comma-separated values) or `pipeline` (JSON
+    list of steps), and `format` (npy, the default, or png).
+    """
+    try:
+        with spooled_body() as body:
+            image_array, _ = decode_array_body(body)
+        
+        if 'pipeline' in request.args:
+            steps = compile_pipeline(parse_pipeline(json.loads(request.args['pipeline'])))
+            filtered_array = run_pipeline(image_array, steps)
+        else:
+            kernel = parse_kernel(request.args.get('kernel', '0,0,0,0,1,0,0,0,0').split(','))
+            filtered_array = apply_convolution(image_array, kernel)
+        
+        body, mimetype = encode_array(filtered_array, request.args.get('format', 'npy'))
+        return Response(body, mimetype=mimetype)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
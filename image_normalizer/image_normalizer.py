@@ -1,22 +1,22 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response
 from werkzeug.utils import secure_filename
 from PIL import Image
 import numpy as np
 import io
 import base64
+from image_decoder.image_decoder import decode_image_array, decode_array_body, encode_array, pyramid_level, is_animated, decode_frames, frames_to_gif_bytes, frame_blocks
+from background_jobs.background_jobs import submit_job, job_status, JobQueueFull
+from http_cache.http_cache import cached_page
+from uploads.uploads import accepts_uploads, spooled_body, IMAGE_KINDS
 
 image_normalizer_bp = Blueprint('image_normalizer', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+# Images with a longer side than this get a preview first and the full result later
+PROGRESSIVE_MIN_SIDE = 1024
+PREVIEW_MAX_SIDE = 512
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def normalize_image(image_array):
-    """Apply mean normalization to the image"""
-    # Convert to float for calculations
-    image_float = image_array.astype(np.float32)
-    
+def normalize_float(image_float):
+    """Mean-normalize a float image and rescale it to the 0-255 range without casting"""
     # Calculate mean for each channel
     if len(image_float.shape) == 3:  # RGB image
         means = np.mean(image_float, axis=(0, 1))
@@ -35,7 +35,40 @@ def normalize_image(image_array):
     else:
         normalized = np.zeros_like(normalized)
     
-    return normalized.astype(np.uint8), means if len(image_float.shape) == 3 else mean
+    return normalized, means if len(image_float.shape) == 3 else mean
+
+def normalize_image(image_array):
+    """Apply mean normalization to the image"""
+    # Convert to float for calculations
+    normalized, means = normalize_float(image_array.astype(np.float32))
+    return normalized.astype(np.uint8), means
+
+def normalize_frames(frames):
+    """Mean-normalize every frame of a (frames, H, W[, C]) volume, each with its own statistics.
+
+    Gives the same result as normalize_image on each frame in turn, but works
+    on many frames per vectorized op. Returns the uint8 volume and the
+    subtracted means, shaped (frames, C) or (frames,).
+    """
+    result = np.empty_like(frames)
+    means = np.empty((len(frames), frames.shape[3] if frames.ndim == 4 else 1), dtype=np.float32)
+    per_frame = tuple(range(1, frames.ndim))
+    
+    for block in frame_blocks(frames):
+        normalized = frames[block].astype(np.float32)
+        block_means = np.mean(normalized, axis=(1, 2), keepdims=True)
+        normalized -= block_means
+        
+        min_val = np.min(normalized, axis=per_frame, keepdims=True)
+        span = np.max(normalized, axis=per_frame, keepdims=True) - min_val
+        normalized -= min_val
+        normalized /= np.where(span > 0, span, 1)
+        normalized *= np.where(span > 0, np.float32(255), np.float32(0))
+        
+        result[block] = normalized
+        means[block] = block_means.reshape(len(normalized), -1)
+    
+    return result, means if frames.ndim == 4 else means[:, 0]
 
 def array_to_base64(image_array):
     """Convert numpy array to base64 string for display"""
@@ -53,11 +86,53 @@ def array_to_base64(image_array):
     encoded_img = base64.b64encode(buffer.read()).decode('utf-8')
     return f"data:image/png;base64,{encoded_img}"
 
+def calculate_stats(image_array, frames=False):
+    """Per-channel (or whole-image for grayscale) mean, std, min and max, over all frames if `frames`"""
+    axis = tuple(range(image_array.ndim - 1)) if image_array.ndim == (4 if frames else 3) else None
+    return {
+        'mean': np.mean(image_array, axis=axis),
+        'std': np.std(image_array, axis=axis),
+        'min': np.min(image_array, axis=axis),
+        'max': np.max(image_array, axis=axis)
+    }
+
+def normalize_and_describe(image_array):
+    """Normalize an image and collect everything the result page shows"""
+    normalized_array, means = normalize_image(image_array)
+    return {
+        'normalized_array': normalized_array,
+        'original_stats': calculate_stats(image_array),
+        'normalized_stats': calculate_stats(normalized_array),
+        'subtracted_means': means
+    }
+
+def to_jsonable(stats):
+    """Convert numpy stats values to plain lists/floats for JSON"""
+    return {key: np.asarray(value).tolist() for key, value in stats.items()}
+
+def normalize_full_resolution(image_array):
+    """Background job: normalize, describe and encode the full-resolution image"""
+    result = normalize_and_describe(image_array)
+    return {
+        'original_image': array_to_base64(image_array),
+        'normalized_image': array_to_base64(result['normalized_array']),
+        'original_stats': to_jsonable(result['original_stats']),
+        'normalized_stats': to_jsonable(result['normalized_stats']),
+        'subtracted_means': np.asarray(result['subtracted_means']).tolist()
+    }
+
+def frames_to_base64(frames, durations):
+    """Encode a frame volume as an animated GIF data URI for display"""
+    encoded_img = base64.b64encode(frames_to_gif_bytes(frames, durations)).decode('utf-8')
+    return f"data:image/gif;base64,{encoded_img}"
+
 @image_normalizer_bp.route('/')
+@cached_page
 def index():
     return render_template('image_normalizer/index.html')
 
 @image_normalizer_bp.route('/upload', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS)
 def upload_and_normalize():
     if 'file' not in request.files:
         flash('No file selected')
@@ -68,51 +143,93 @@ def upload_and_normalize():
         flash('No file selected')
         return redirect(url_for('image_normalizer.index'))
     
-    if not allowed_file(file.filename):
-        flash('Invalid file type. Please upload an image file.')
-        return redirect(url_for('image_normalizer.index'))
-    
     try:
-        # Process image
-        image = Image.open(file.stream)
-        
-        # Convert to RGB if needed
-        if image.mode not in ['RGB', 'L']:
-            image = image.convert('RGB')
-        
-        image_array = np.array(image)
+        # Animated GIF / TIFF stack: normalize all frames at once and send back an animation
+        if is_animated(file.stream):
+            frames, durations, decode_stats = decode_frames(file.stream, mode=('RGB', 'L'))
+            normalized_frames, frame_means = normalize_frames(frames)
+            
+            return render_template('image_normalizer/result.html', 
+                                 original_image=frames_to_base64(frames, durations),
+                                 normalized_image=frames_to_base64(normalized_frames, durations),
+                                 original_stats=calculate_stats(frames, frames=True),
+                                 normalized_stats=calculate_stats(normalized_frames, frames=True),
+                                 subtracted_means=np.mean(frame_means, axis=0),
+                                 decode_stats=decode_stats,
+                                 filename=secure_filename(file.filename),
+                                 is_color=frames.ndim == 4)
         
-        # Apply normalization
-        normalized_array, means = normalize_image(image_array)
+        # Process image, converting to RGB if needed
+        image_array, decode_stats = decode_image_array(file.stream, mode=('RGB', 'L'))
         
-        # Calculate statistics
-        original_stats = {
-            'mean': np.mean(image_array, axis=(0, 1)) if len(image_array.shape) == 3 else np.mean(image_array),
-            'std': np.std(image_array, axis=(0, 1)) if len(image_array.shape) == 3 else np.std(image_array),
-            'min': np.min(image_array, axis=(0, 1)) if len(image_array.shape) == 3 else np.min(image_array),
-            'max': np.max(image_array, axis=(0, 1)) if len(image_array.shape) == 3 else np.max(image_array)
-        }
+        # Large image: describe a preview level now, finish full resolution in the background
+        job_id = None
+        preview_scale = 1
+        if max(image_array.shape[:2]) > PROGRESSIVE_MIN_SIDE:
+            try:
+                job_id = submit_job(normalize_full_resolution, image_array)
+            except JobQueueFull:
+                pass  # Job store is full: normalize at full resolution in this request instead
+            else:
+                preview_source, preview_scale = pyramid_level(image_array, PREVIEW_MAX_SIDE)
+                image_array = np.clip(np.rint(preview_source), 0, 255).astype(np.uint8)
         
-        normalized_stats = {
-            'mean': np.mean(normalized_array, axis=(0, 1)) if len(normalized_array.shape) == 3 else np.mean(normalized_array),
-            'std': np.std(normalized_array, axis=(0, 1)) if len(normalized_array.shape) == 3 else np.std(normalized_array),
-            'min': np.min(normalized_array, axis=(0, 1)) if len(normalized_array.shape) == 3 else np.min(normalized_array),
-            'max': np.max(normalized_array, axis=(0, 1)) if len(normalized_array.shape) == 3 else np.max(normalized_array)
-        }
+        # Apply normalization and calculate statistics
+        result = normalize_and_describe(image_array)
         
         # Convert to base64 for display
         original_b64 = array_to_base64(image_array)
-        normalized_b64 = array_to_base64(normalized_array)
+        normalized_b64 = array_to_base64(result['normalized_array'])
         
         return render_template('image_normalizer/result.html', 
                              original_image=original_b64,
                              normalized_image=normalized_b64,
-                             original_stats=original_stats,
-                             normalized_stats=normalized_stats,
-                             subtracted_means=means,
+                             original_stats=result['original_stats'],
+                             normalized_stats=result['normalized_stats'],
+                             subtracted_means=result['subtracted_means'],
+                             job_id=job_id,
+                             preview_scale=preview_scale,
+                             decode_stats=decode_stats,
                              filename=secure_filename(file.filename),
                              is_color=len(image_array.shape) == 3)
     
     except Exception as e:
         flash(f'Error processing image: {str(e)}')
         return redirect(url_for('image_normalizer.index'))
+
+@image_normalizer_bp.route('/result/<job_id>')
+def full_result(job_id):
+    """Poll for the full-resolution result of a progressive upload"""
+    status = job_status(job_id)
+    return jsonify(status), 404 if status['status'] == 'missing' else 200
+
+@image_normalizer_bp.route('/api/normalize', methods=['POST'])
+@accepts_uploads(*IMAGE_KINDS, 'npy')
+def api_normalize():
+    """Normalize a raw image or .npy request body.
+
+    `format=json` (the default) returns only the statistics; `npy` and `png`
+    return the normalized image as raw bytes.
+    """
+    try:
+        with spooled_body() as body:
+            image_array, _ = decode_array_body(body, mode=('RGB', 'L'))
+        output_format = request.args.get('format', 'json')
+        
+        if output_format == 'json':
+            result = normalize_and_describe(image_array)
+            return jsonify({
+                'shape': list(image_array.shape),
+                'original_stats': to_jsonable(result['original_stats']),
+                'normalized_stats': to_jsonable(result['normalized_stats']),
+                'subtracted_means': np.asarray(result['subtracted_means']).tolist()
+            })
+        
+        normalized_array, _ = normalize_image(image_array)
+        body, mimetype = encode_array(normalized_array, output_format)
+        return Response(body, mimetype=mimetype)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
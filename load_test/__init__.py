@@ -0,0 +1 @@
+# Load Test Package
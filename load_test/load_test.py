@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Load-test harness: drive a weighted mix of dashboard traffic at a fixed
+concurrency and report throughput, latency percentiles and error rates per
+route. Gemini and OpenAI are replaced with in-process fakes, so runs are free,
+repeatable and limited only by the app itself.
+
+Usage:
+    python -m load_test.load_test [options]                 # in-process, via the Flask test client
+    python -m load_test.load_test --serve --port 5003       # serve the app with fake providers
+    python -m load_test.load_test --url http://localhost:5003 [options]
+
+Compare serving configurations by starting the app once per configuration
+(e.g. --serve vs --serve --processes 4) and pointing the same --url run at
+each. The in-process mode measures the app alone, without any HTTP stack.
+"""
+
+import argparse
+import io
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+from ai_providers.ai_providers import FakeProvider, provider_metrics
+
+FAKE_AI_TEXT = (
+    'TOKENS: load | test | token\n'
+    'COUNT: 3\n'
+    'EXPLANATION: Stand-in response from the load-test fake provider.\n'
+    + json.dumps({f'block_{n}': f'Stand-in description of CNN block {n}.' for n in range(1, 5)})
+)
+
+SCENARIOS = ('filter_small', 'filter_large', 'normalize', 'token', 'token_ai', 'one_hot', 'cnn_upload', 'cnn_block', 'cnn_all')
+DEFAULT_MIX = 'filter_small=3,filter_large=1,normalize=2,token=3,token_ai=1,one_hot=2,cnn_upload=1,cnn_block=2,cnn_all=1'
+
+WORDS = ('cat dog bird fish tree river stone cloud light shadow signal vector matrix token '
+         'kernel filter pixel layer model batch').split()
+
+def install_fake_providers(delay=0.2, fail_every=0):
+    """Point every Gemini/OpenAI client the app uses at in-process fakes"""
+    from cnn_visualizer import cnn_visualizer
+    from token_length_checker import token_checker
+
+    gemini = SimpleNamespace(models=SimpleNamespace(
+        generate_content=FakeProvider(delay, fail_every, response=SimpleNamespace(text=FAKE_AI_TEXT))))
+    openai_client = SimpleNamespace(images=SimpleNamespace(
+        generate=FakeProvider(delay, fail_every, response=SimpleNamespace(data=[SimpleNamespace(url='fake://image')]))))
+    # The generated image is "downloaded" from the fake URL without touching the network
+    image_bytes = encode_image(smooth_image(256, 256, seed=0), 'PNG')
+    downloader = SimpleNamespace(get=lambda url, timeout=None: SimpleNamespace(status_code=200, content=image_bytes))
+
+    for module in (cnn_visualizer, token_checker):
+        module.client = gemini
+        module.model = 'fake-gemini'
+    cnn_visualizer.openai_client = openai_client
+    cnn_visualizer.requests = downloader
+
+def smooth_image(width, height, seed):
+    """A photo-like test image: upscaled low-resolution noise, so it compresses like a real picture"""
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray((rng.random((max(height // 32, 2), max(width // 32, 2), 3)) * 255).astype(np.uint8))
+    return coarse.resize((width, height), Image.Resampling.BICUBIC)
+
+def encode_image(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+def build_payloads(variants=4):
+    """Pre-encode request bodies so the generator spends its time sending, not building"""
+    rng = random.Random(0)
+    return {
+        'small_png': [encode_image(smooth_image(256, 256, seed), 'PNG') for seed in range(variants)],
+        'medium_png': [encode_image(smooth_image(512, 512, seed), 'PNG') for seed in range(variants)],
+        'large_jpeg': [encode_image(smooth_image(2048, 2048, seed), 'JPEG') for seed in range(variants)],
+        'text': ' '.join(rng.choice(WORDS) + rng.choice(',.!? ') for _ in range(4000)),
+    }
+
+def make_request(scenario, payloads, rng, sequence):
+    """Describe one request as {'path', 'form', 'files', 'json'}"""
+    kernel = {f'kernel_{i}': value for i, value in enumerate([0, -1, 0, -1, 5, -1, 0, -1, 0])}
+    # A per-request suffix keeps the AI description caches from answering instead of the provider
+    description = f'Load-test image #{sequence}: a landscape with trees, a river and clouds.'
+
+    if scenario == 'filter_small':
+        return {'path': '/image-filter/upload', 'form': kernel,
+                'files': {'file': ('small.png', rng.choice(payloads['small_png']))}}
+    if scenario == 'filter_large':
+        return {'path': '/image-filter/upload', 'form': kernel,
+                'files': {'file': ('large.jpg', rng.choice(payloads['large_jpeg']))}}
+    if scenario == 'normalize':
+        return {'path': '/image-normalizer/upload', 'files': {'file': ('medium.png', rng.choice(payloads['medium_png']))}}
+    if scenario == 'token':
+        return {'path': '/token-checker/analyze',
+                'form': {'text': payloads['text'], 'method': rng.choice(['whitespace', 'punctuation', 'subword'])}}
+    if scenario == 'token_ai':
+        return {'path': '/token-checker/ai_tokenize', 'json': {'text': payloads['text'][:1500]}}
+    if scenario == 'one_hot':
+        words = ' '.join(rng.choice(WORDS) for _ in range(200))
+        return {'path': '/one-hot-vector/process', 'form': {'words': words}}
+    if scenario == 'cnn_upload':
+        return {'path': '/cnn-visualizer/upload', 'files': {'file': ('photo.png', rng.choice(payloads['medium_png']))}}
+    if scenario == 'cnn_block':
+        return {'path': '/cnn-visualizer/visualize_block',
+                'json': {'block_number': rng.randint(1, 4), 'image_description': description, 'generate_image': True}}
+    if scenario == 'cnn_all':
+        return {'path': '/cnn-visualizer/visualize_all', 'json': {'image_description': description}}
+    raise ValueError(f'Unknown scenario {scenario!r}')
+
+# Fields JSON routes use to report failures inside a 200 response (e.g. a failed provider call)
+ERROR_FIELDS = ('error', 'errors', 'visualization_error', 'image_error')
+
+def is_success(status_code, body):
+    """Form routes report errors by flashing and redirecting; JSON routes via error fields"""
+    if status_code != 200:
+        return False
+    if body[:1] != b'{':
+        return True
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return False
+    return not any(data.get(field) for field in ERROR_FIELDS)
+
+class InProcessTarget:
+    """Send requests through the Flask test client, in this process"""
+
+    def __init__(self):
+        from main import app
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, request):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        if 'json' in request:
+            response = self._local.client.post(request['path'], json=request['json'])
+        else:
+            data = dict(request.get('form', {}))
+            for field, (filename, content) in request.get('files', {}).items():
+                data[field] = (io.BytesIO(content), filename)
+            response = self._local.client.post(request['path'], data=data, content_type='multipart/form-data')
+        return response.status_code, response.get_data()
+
+class HttpTarget:
+    """Send requests over HTTP to a running server, one keep-alive session per worker"""
+
+    def __init__(self, base_url):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    def send(self, request):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self.requests.Session()
+        url = self.base_url + request['path']
+        if 'json' in request:
+            response = self._local.session.post(url, json=request['json'], allow_redirects=False, timeout=120)
+        else:
+            response = self._local.session.post(url, data=request.get('form'), files=request.get('files'),
+                                                allow_redirects=False, timeout=120)
+        return response.status_code, response.content
+
+def parse_mix(mix):
+    """Parse 'scenario=weight,...' into (scenarios, weights)"""
+    scenarios, weights = [], []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        scenarios.append(name.strip())
+        weights.append(float(weight or 1))
+    return scenarios, weights
+
+def run_load(target, scenarios, weights, concurrency, duration=None, total_requests=None, seed=0):
+    """Run workers until the duration or request budget is spent; returns per-scenario samples"""
+    payloads = build_payloads()
+    samples = {name: [] for name in scenarios}  # name -> [(latency_s, ok, status)]
+    samples_lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    counter_lock = threading.Lock()
+
+    def next_sequence():
+        with counter_lock:
+            sequence = next(counter)
+        if total_requests is not None and sequence >= total_requests:
+            return None
+        if duration is not None and time.perf_counter() - start >= duration:
+            return None
+        return sequence
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        local = {name: [] for name in scenarios}
+        while (sequence := next_sequence()) is not None:
+            scenario = rng.choices(scenarios, weights)[0]
+            request = make_request(scenario, payloads, rng, sequence)
+            began = time.perf_counter()
+            try:
+                status, body = target.send(request)
+                ok = is_success(status, body)
+            except Exception as e:
+                status, ok = type(e).__name__, False
+            local[scenario].append((time.perf_counter() - began, ok, status))
+        with samples_lock:
+            for name, results in local.items():
+                samples[name].extend(results)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples, time.perf_counter() - start
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles and error rate per scenario, plus an overall row"""
+    def describe(results):
+        latencies = np.array([latency for latency, _, _ in results]) * 1000
+        errors = sum(1 for _, ok, _ in results if not ok)
+        statuses = {}
+        for _, _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': len(results),
+            'throughput_rps': len(results) / elapsed if elapsed > 0 else 0,
+            'p50_ms': float(np.percentile(latencies, 50)) if latencies.size else None,
+            'p95_ms': float(np.percentile(latencies, 95)) if latencies.size else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if latencies.size else None,
+            'error_rate': errors / len(results) if results else 0,
+            'statuses': statuses,
+        }
+
+    report = {name: describe(results) for name, results in samples.items() if results}
+    report['TOTAL'] = describe([sample for results in samples.values() for sample in results])
+    return report
+
+def print_report(report, elapsed, concurrency):
+    print(f'\n📊 {report["TOTAL"]["requests"]} requests in {elapsed:.1f}s at concurrency {concurrency}\n')
+    print(f'{"route":<14}{"reqs":>7}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>9}')
+    for name, row in report.items():
+        print(f'{name:<14}{row["requests"]:>7}{row["throughput_rps"]:>9.1f}{row["p50_ms"]:>10.1f}'
+              f'{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["error_rate"]:>8.1%}')
+    failing = {name: row['statuses'] for name, row in report.items() if name != 'TOTAL' and row['error_rate']}
+    for name, statuses in failing.items():
+        print(f'⚠️  {name}: responses by status {statuses}')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the dashboard with fake AI providers.')
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process test client)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run (ignored with --requests)')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests instead of after --duration')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Comma-separated scenario=weight pairs')
+    parser.add_argument('--ai-delay', type=float, default=0.2, help='Seconds each fake AI call takes')
+    parser.add_argument('--ai-fail-every', type=int, default=0, help='Make every Nth fake AI call fail (0: never)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the report to this JSON file')
+    parser.add_argument('--serve', action='store_true', help='Serve the app with fake providers instead of generating load')
+    parser.add_argument('--port', type=int, default=5003, help='Port for --serve')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes for --serve (1: threaded)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.serve:
+        from main import app
+        install_fake_providers(args.ai_delay, args.ai_fail_every)
+        print(f'🧪 Serving with fake AI providers on http://localhost:{args.port} '
+              f'({"threaded" if args.processes == 1 else f"{args.processes} processes"})')
+        app.run(host='0.0.0.0', port=args.port, threaded=args.processes == 1, processes=args.processes)
+        return 0
+
+    scenarios, weights = parse_mix(args.mix)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f'❌ Unknown scenario(s) {", ".join(unknown)}; choose from {", ".join(SCENARIOS)}')
+        return 1
+
+    if args.url:
+        target = HttpTarget(args.url)
+        print(f'🎯 Target: {args.url} (its AI providers must be faked, e.g. started with --serve)')
+    else:
+        target = InProcessTarget()
+        install_fake_providers(args.ai_delay, args.ai_fail_every)
+        print('🎯 Target: in-process Flask test client with fake AI providers')
+
+    duration = None if args.requests else args.duration
+    samples, elapsed = run_load(target, scenarios, weights, args.concurrency, duration, args.requests, args.seed)
+    report = summarize(samples, elapsed)
+    print_report(report, elapsed, args.concurrency)
+
+    if not args.url:
+        print(f'\n🔌 Provider guards: {json.dumps({name: {k: v for k, v in m.items() if k != "latency_ms"} for name, m in provider_metrics().items()})}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'elapsed_s': elapsed, 'routes': report}, f, indent=2)
+        print(f'📝 Report written to {args.json}')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
 import os
 from werkzeug.utils import secure_filename
 import tempfile
@@ -9,14 +9,21 @@ from image_normalizer.image_normalizer import image_normalizer_bp
 from token_length_checker.token_checker import token_checker_bp
 from word_to_one_hot_vector.one_hot_vector import one_hot_vector_bp
 from cnn_visualizer.cnn_visualizer import cnn_visualizer_bp
+from ai_providers.ai_providers import provider_metrics
+from http_cache.http_cache import finalize_response, cached_page
+from uploads.uploads import UploadRequest
+from profiling import profiling
 
 app = Flask(__name__)
+app.request_class = UploadRequest  # Spool, hash and type-check uploads while they stream in
 app.secret_key = 'your-secret-key-change-this'
 
 # Configure upload settings
 UPLOAD_FOLDER = tempfile.gettempdir()
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_REQUEST_MB', '16')) * 1024 * 1024  # Bodies read into memory
+app.config['MAX_UPLOAD_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '256')) * 1024 * 1024  # @accepts_uploads views spool to UPLOAD_FOLDER
+app.config['MAX_DECODE_MEGAPIXELS'] = float(os.getenv('MAX_DECODE_MEGAPIXELS', '50'))  # Decoded pixel budget
 
 # Register blueprints
 app.register_blueprint(image_filter_bp, url_prefix='/image-filter')
@@ -25,15 +32,41 @@ app.register_blueprint(token_checker_bp, url_prefix='/token-checker')
 app.register_blueprint(one_hot_vector_bp, url_prefix='/one-hot-vector')
 app.register_blueprint(cnn_visualizer_bp, url_prefix='/cnn-visualizer')
 
+# ETags, conditional GETs and gzip/brotli compression for every response
+app.after_request(finalize_response)
+
+# Opt-in per-request profiling; a no-op unless PROFILING_ADMIN_TOKEN is set
+profiling.init_app(app)
+
 @app.route('/')
+@cached_page
 def index():
     """Main page with navigation to all tools"""
     return render_template('index.html')
 
+@app.route('/health')
+def health():
+    """Liveness check for container healthchecks; renders nothing and calls nothing"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/metrics/providers')
+def providers_metrics():
+    """Latency, failure and circuit-breaker state for each AI provider"""
+    return jsonify(provider_metrics())
+
+def upload_form_url():
+    """The form page of the tool a rejected upload was posted to"""
+    return url_for(f'{request.blueprint}.index') if request.blueprint else url_for('index')
+
 @app.errorhandler(413)
 def too_large(e):
     flash('File is too large. Please upload a smaller image.')
-    return redirect(request.url)
+    return redirect(upload_form_url())
+
+@app.errorhandler(415)
+def unsupported_upload(e):
+    flash(e.description)
+    return redirect(upload_form_url())
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,184 @@
+from flask import Blueprint, render_template, request, g, abort, send_from_directory
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from urllib.parse import urlencode
+
+# Profiling is only wired into the app when an admin token is configured
+ADMIN_TOKEN = os.getenv('PROFILING_ADMIN_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'dashboard-profiles'))
+MAX_PROFILES = int(os.getenv('PROFILE_KEEP', '100'))
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+profiling_bp = Blueprint('profiling', __name__)
+
+# cProfile and tracemalloc are process-wide, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+def request_token():
+    return request.headers.get('X-Admin-Token') or request.args.get('token')
+
+def is_admin():
+    """True if this request carries the admin token (header or query).
+
+    Checked on every request and never remembered in the session: the session
+    cookie is only as secret as app.secret_key.
+    """
+    token = request_token()
+    return bool(token) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def scrubbed_path():
+    """Request path and query string with the admin token removed, safe to save"""
+    query = urlencode([(key, value) for key, value in request.args.items(multi=True) if key != 'token'])
+    return f'{request.path}?{query}' if query else request.path
+
+def wants_profile():
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+def start_profile():
+    """before_request hook: start cProfile and tracemalloc for flagged admin requests"""
+    if not wants_profile() or not is_admin():
+        return
+    if not _profile_lock.acquire(blocking=False):
+        g.profile_busy = True
+        return
+
+    # Sortable by name: timestamp to the millisecond, then a random suffix
+    now = time.time()
+    profile_id = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}'
+    g.profile = {'id': profile_id, 'start': time.perf_counter(), 'profiler': cProfile.Profile()}
+    tracemalloc.start()
+    g.profile['profiler'].enable()
+
+def tag_response(response):
+    """after_request hook: remember the status and tell the caller where the profile went"""
+    if 'profile' in g:
+        g.profile['status'] = response.status_code
+        response.headers['X-Profile-Id'] = g.profile['id']
+    elif g.get('profile_busy'):
+        response.headers['X-Profile-Id'] = 'busy'
+    return response
+
+def finish_profile(exc=None):
+    """teardown_request hook: stop profiling and save results, even if the view raised"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    try:
+        profile['profiler'].disable()
+        duration_ms = (time.perf_counter() - profile['start']) * 1000
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        _profile_lock.release()
+
+    save_profile(profile['id'], profile['profiler'], snapshot, {
+        'id': profile['id'],
+        'method': request.method,
+        'path': scrubbed_path(),
+        'status': profile.get('status', 500) if exc is None else 500,
+        'duration_ms': duration_ms,
+        'peak_memory_bytes': peak_bytes,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
+def save_profile(profile_id, profiler, snapshot, meta):
+    """Write <id>.prof (pstats) and <id>.json (summary and top allocation sites), then prune.
+
+    Allocation sites come from a snapshot taken as the request finishes, so they
+    show what the request left allocated; the peak covers everything in between.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.prof'))
+
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    allocations = [{
+        'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'size_bytes': stat.size,
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]]
+
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w') as f:
+        json.dump({**meta, 'top_functions': stats_text.getvalue(), 'top_allocations': allocations}, f)
+
+    prune_profiles()
+
+def list_profiles():
+    """Saved profile summaries, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+def prune_profiles():
+    """Keep only the newest MAX_PROFILES profiles"""
+    ids = sorted((name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith('.json')), reverse=True)
+    for profile_id in ids[MAX_PROFILES:]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + extension))
+            except OSError:
+                pass
+
+def load_profile(profile_id):
+    if not re.fullmatch(r'[\w-]+', profile_id):
+        abort(404)
+    path = os.path.join(PROFILE_DIR, f'{profile_id}.json')
+    if not os.path.exists(path):
+        abort(404)
+    with open(path) as f:
+        return json.load(f)
+
+@profiling_bp.before_request
+def require_admin():
+    if not is_admin():
+        abort(403)
+
+@profiling_bp.route('/')
+def index():
+    # Links carry the token along, since admin status is not kept in the session
+    return render_template('profiling/index.html', profiles=list_profiles(), profile_dir=PROFILE_DIR,
+                           token=request.args.get('token'))
+
+@profiling_bp.route('/<profile_id>')
+def detail(profile_id):
+    return render_template('profiling/detail.html', profile=load_profile(profile_id),
+                           token=request.args.get('token'))
+
+@profiling_bp.route('/<profile_id>/download')
+def download(profile_id):
+    load_profile(profile_id)
+    return send_from_directory(PROFILE_DIR, f'{profile_id}.prof', as_attachment=True)
+
+def init_app(app):
+    """Register the profiling hooks and admin pages, but only when PROFILING_ADMIN_TOKEN is set.
+
+    Without a token nothing is registered, so unprofiled requests pay nothing.
+    """
+    if not ADMIN_TOKEN:
+        return
+    app.before_request(start_profile)
+    app.after_request(tag_response)
+    app.teardown_request(finish_profile)
+    app.register_blueprint(profiling_bp, url_prefix='/admin/profiles')
@@ -0,0 +1,31 @@
+from flask import Flask
+import pytest
+
+from profiling import profiling
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', 's3cret')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    app = Flask(__name__)
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    profiling.init_app(app)
+    return app.test_client()
+
+def test_non_ascii_token_is_rejected(client):
+    response = client.get('/admin/profiles/', query_string={'token': 'é'})
+    assert response.status_code == 403
+
+    response = client.get('/admin/profiles/', headers={'X-Admin-Token': 'é'.encode('utf-8').decode('latin-1')})
+    assert response.status_code == 403
+
+def test_non_ascii_token_does_not_profile(client, tmp_path):
+    response = client.get('/ping', query_string={'profile': '1', 'token': 'é'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert not list(tmp_path.iterdir())
+
+def test_admin_token_is_accepted(client):
+    response = client.get('/ping', query_string={'profile': '1', 'token': 's3cret'})
+    assert response.status_code == 200
+    assert response.headers['X-Profile-Id'] != 'busy'
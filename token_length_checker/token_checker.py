@@ -1,9 +1,19 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context, current_app
 import re
-from collections import Counter
+import json
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import os
 from dotenv import load_dotenv
 import google.genai as genai
+import io
+from token_length_checker.token_sketches import sketch_tokenize_text
+from ai_providers.ai_providers import call_provider, CALL_TIMEOUT
+from http_cache.http_cache import cached_page
+from uploads.uploads import accepts_uploads
 
 # Load environment variables
 load_dotenv()
@@ -12,7 +22,8 @@ token_checker_bp = Blueprint('token_checker', __name__)
 
 # Configure Gemini API
 try:
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'),
+                          http_options=genai.types.HttpOptions(timeout=int(CALL_TIMEOUT * 1000)))
     model = 'gemini-2.0-flash-exp'
 except Exception as e:
     print(f"Warning: Could not configure Gemini API for token checker: {e}")
@@ -71,6 +82,108 @@ def advanced_tokenize(text, method='whitespace'):
     else:
         return text.split()
 
+# Worker pool for the batch endpoint; tokenization is CPU-bound so it runs in processes
+BATCH_WORKERS = int(os.getenv('TOKEN_BATCH_WORKERS', str(os.cpu_count() or 1)))
+BATCH_CHUNK_SIZE = 256  # Documents per worker task
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            # Never fork the threaded server: a forked child can inherit locks held by other threads
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _batch_executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS,
+                                                  mp_context=multiprocessing.get_context(start_method))
+        return _batch_executor
+
+def discard_batch_executor(executor):
+    """Drop a broken pool so the next batch starts a fresh one"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is executor:
+            _batch_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def analyze_document(doc_id, text, method='whitespace', include_tokens=False):
+    """Token statistics for one document, as a JSON-serialisable dict"""
+    analysis = tokenize_text(text)
+    advanced_tokens = advanced_tokenize(text, method)
+    
+    result = {
+        'id': doc_id,
+        'total_tokens': analysis['total_tokens'],
+        'unique_count': analysis['unique_count'],
+        'avg_token_length': analysis['avg_token_length'],
+        'total_chars': analysis['total_chars'],
+        'chars_no_spaces': analysis['chars_no_spaces'],
+        'most_common': analysis['most_common'],
+        'advanced_token_count': len(advanced_tokens),
+        'advanced_unique_count': len(set(advanced_tokens))
+    }
+    if include_tokens:
+        result['tokens'] = analysis['tokens']
+        result['advanced_tokens'] = advanced_tokens
+    return result
+
+def analyze_documents(docs, method='whitespace', include_tokens=False):
+    """Worker task: analyze a chunk of (id, text) pairs, reporting bad documents inline"""
+    results = []
+    for doc_id, text in docs:
+        if isinstance(text, ValueError):
+            results.append({'id': doc_id, 'error': str(text)})
+            continue
+        if not isinstance(text, str):
+            results.append({'id': doc_id, 'error': 'Document text must be a string'})
+            continue
+        results.append(analyze_document(doc_id, text, method, include_tokens))
+    return results
+
+def parse_document(raw, position):
+    """Accept either a bare string or an object with a text (and optional id) field"""
+    if isinstance(raw, dict):
+        return raw.get('id', position), raw.get('text')
+    return position, raw
+
+def iter_documents():
+    """Yield (id, text) pairs from a JSON array body or a JSONL stream"""
+    if request.mimetype == 'application/json':
+        # A JSON array is parsed in memory, so only the ordinary request limit applies
+        request.max_content_length = current_app.config['MAX_CONTENT_LENGTH']
+        data = request.get_json(silent=True)
+        if data is None:
+            raise ValueError('Request body is not valid JSON')
+        if isinstance(data, dict):
+            data = data.get('documents')
+        if not isinstance(data, list):
+            raise ValueError('Expected a JSON array of documents or {"documents": [...]}')
+        for position, raw in enumerate(data):
+            yield parse_document(raw, position)
+        return
+    
+    # JSONL: read line by line so the whole body is never held at once
+    position = 0
+    for line in request.stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield parse_document(json.loads(line), position)
+        except json.JSONDecodeError as e:
+            yield position, ValueError(f'Invalid JSON line: {e}')
+        position += 1
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 def get_ai_tokenization(text):
     """Get tokenization using Gemini's actual tokenizer"""
     if not client or not model:
@@ -96,7 +209,7 @@ def get_ai_tokenization(text):
         Be precise and accurate - this is for educational purposes to understand how language models actually process text.
         """
         
-        response = client.models.generate_content(
+        response = call_provider('gemini', client.models.generate_content,
             model=model,
             contents=prompt
         )
@@ -155,34 +268,58 @@ def parse_ai_tokenization(ai_response):
         }
 
 @token_checker_bp.route('/')
+@cached_page
 def index():
     return render_template('token_checker/index.html')
 
 @token_checker_bp.route('/analyze', methods=['POST'])
+@accepts_uploads('text')
 def analyze_text():
     text = request.form.get('text', '').strip()
     method = request.form.get('method', 'whitespace')
+    stats_mode = request.form.get('stats_mode', 'exact')
+    corpus = request.files.get('corpus')
     
-    if not text:
+    if corpus and corpus.filename:
+        # Uploaded corpora are only ever streamed through the fixed-memory sketches
+        stats_mode = 'approximate'
+        text = ''
+    elif not text:
         flash('Please enter some text to analyze.')
         return redirect(url_for('token_checker.index'))
     
     try:
-        # Perform basic analysis
-        basic_analysis = tokenize_text(text)
+        basic_analysis = None
+        advanced_tokens = None
+        advanced_token_count = None
+        advanced_unique_count = None
+        sketch_analysis = None
+        
+        if stats_mode in ('exact', 'both'):
+            # Perform basic analysis
+            basic_analysis = tokenize_text(text)
+            
+            # Perform advanced tokenization based on selected method
+            advanced_tokens = advanced_tokenize(text, method)
+            advanced_token_count = len(advanced_tokens)
+            advanced_unique_count = len(set(advanced_tokens))
         
-        # Perform advanced tokenization based on selected method
-        advanced_tokens = advanced_tokenize(text, method)
-        advanced_token_count = len(advanced_tokens)
-        advanced_unique_count = len(set(advanced_tokens))
+        if stats_mode in ('approximate', 'both'):
+            if text:
+                sketch_analysis = sketch_tokenize_text(text)
+            else:
+                lines = io.TextIOWrapper(corpus.stream, encoding='utf-8', errors='replace')
+                sketch_analysis = sketch_tokenize_text(lines)
         
         return render_template('token_checker/result.html',
                              text=text,
+                             corpus_name=corpus.filename if corpus and corpus.filename else None,
                              method=method,
                              basic_analysis=basic_analysis,
                              advanced_tokens=advanced_tokens,
                              advanced_token_count=advanced_token_count,
-                             advanced_unique_count=advanced_unique_count)
+                             advanced_unique_count=advanced_unique_count,
+                             sketch_analysis=sketch_analysis)
     
     except Exception as e:
         flash(f'Error analyzing text: {str(e)}')
@@ -220,3 +357,42 @@ def ai_tokenize():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@token_checker_bp.route('/api/batch', methods=['POST'])
+@accepts_uploads('text')  # JSONL bodies are streamed, so they get the upload limit
+def analyze_batch():
+    """Analyze many documents and stream back one JSON line of stats per document.
+
+    The body is a JSON array (of strings or {"id", "text"} objects) or a JSONL
+    stream of the same. Query parameters: `method` (advanced tokenizer) and
+    `include_tokens` (include full token lists; off by default).
+    """
+    method = request.args.get('method', 'whitespace')
+    include_tokens = request.args.get('include_tokens', 'false').lower() in ('1', 'true', 'yes')
+    
+    if request.mimetype == 'application/json':
+        # Validate the array up front so a malformed body gets a proper 400
+        try:
+            documents = list(iter_documents())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        documents = iter_documents()
+    
+    def generate():
+        executor = get_batch_executor()
+        in_flight = deque()
+        try:
+            for chunk in iter_chunks(documents, BATCH_CHUNK_SIZE):
+                in_flight.append(executor.submit(analyze_documents, chunk, method, include_tokens))
+                # Keep a bounded number of chunks outstanding and emit results in input order
+                while len(in_flight) >= BATCH_WORKERS * 2:
+                    yield from (json.dumps(result) + '\n' for result in in_flight.popleft().result())
+            while in_flight:
+                yield from (json.dumps(result) + '\n' for result in in_flight.popleft().result())
+        except BrokenProcessPool:
+            # The status line has already gone out, so report the failure in-band
+            discard_batch_executor(executor)
+            yield json.dumps({'error': 'A batch worker process died; please retry the request'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,193 @@
+from collections import Counter
+import hashlib
+import math
+import re
+
+import numpy as np
+
+# Tokens are buffered and folded into the sketches this many at a time
+CHUNK_SIZE = 10000
+
+def hash64(item):
+    """Stable 64-bit hash of a string (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class HyperLogLog:
+    """Approximate distinct counter using 2**precision one-byte registers"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = np.zeros(self.num_registers, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        # frexp gives the bit length of each value (0 for 0) without a Python loop
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (remaining_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    @property
+    def relative_error(self):
+        """Standard error of the estimate, as a fraction"""
+        return 1.04 / math.sqrt(self.num_registers)
+
+    @property
+    def memory_bytes(self):
+        return self.registers.nbytes
+
+class CountMinTopK:
+    """Count-Min sketch for frequencies plus a bounded candidate set for the top-k"""
+
+    def __init__(self, epsilon=0.0005, delta=0.01, k=10):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.epsilon = epsilon
+        self.delta = delta
+        self.k = k
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+        self.candidates = {}
+
+    def _indices(self, hashes):
+        """Row-wise bucket indices via double hashing: h1 + i*h2 mod width"""
+        hashes = np.array(hashes, dtype=np.uint64)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, np.newaxis]
+        return ((h1 + rows * h2) % np.uint64(self.width)).astype(np.intp)
+
+    def add_counts(self, counts, hashes=None):
+        """Fold a {item: count} chunk into the sketch and refresh the top-k candidates"""
+        if not counts:
+            return
+        items = list(counts)
+        if hashes is None:
+            hashes = [hash64(item) for item in items]
+        indices = self._indices(hashes)
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(items))
+        for row in range(self.depth):
+            np.add.at(self.table[row], indices[row], values)
+        self.total += int(values.sum())
+
+        estimates = self.table[np.arange(self.depth)[:, np.newaxis], indices].min(axis=0)
+        
+        # Only items that could beat the current weakest candidate need a closer look
+        if len(self.candidates) >= self.k:
+            threshold = min(self.candidates.values())
+            keep = np.flatnonzero(estimates > threshold).tolist()
+            keep += [i for i, item in enumerate(items) if item in self.candidates and estimates[i] <= threshold]
+            items = [items[i] for i in keep]
+            estimates = estimates[keep]
+        
+        for item, estimate in zip(items, estimates.tolist()):
+            if item in self.candidates or len(self.candidates) < self.k:
+                self.candidates[item] = estimate
+                continue
+            weakest = min(self.candidates, key=self.candidates.get)
+            if estimate > self.candidates[weakest]:
+                del self.candidates[weakest]
+                self.candidates[item] = estimate
+
+    def most_common(self):
+        return sorted(self.candidates.items(), key=lambda pair: (-pair[1], pair[0]))
+
+    @property
+    def error_bound(self):
+        """Counts overestimate by at most this much with probability 1 - delta"""
+        return self.epsilon * self.total
+
+    @property
+    def memory_bytes(self):
+        return self.table.nbytes
+
+def iter_tokens(source):
+    """Yield whitespace tokens from a string or an iterable of lines without building a list"""
+    if isinstance(source, str):
+        source = (source,)
+    for chunk in source:
+        for match in re.finditer(r'\S+', chunk):
+            yield match.group()
+
+class StreamingTokenStats:
+    """Fixed-memory token statistics: distinct count, top-k tokens and top-k n-grams"""
+
+    def __init__(self, top_k=10, ngram_sizes=(2, 3)):
+        self.hll = HyperLogLog()
+        self.tokens = CountMinTopK(k=top_k)
+        self.ngrams = {n: CountMinTopK(k=top_k) for n in ngram_sizes}
+        self.carry = []
+        self.total_tokens = 0
+        self.total_token_chars = 0
+
+    def _flush(self, chunk):
+        counts = Counter(chunk)
+        hashes = [hash64(token) for token in counts]
+        self.hll.add_hashes(hashes)
+        self.tokens.add_counts(counts, hashes)
+
+        # Carry the tail of the previous chunk so n-grams spanning the boundary are counted
+        window = self.carry + chunk
+        for n, sketch in self.ngrams.items():
+            start = len(self.carry) - (n - 1)
+            if start < 0:
+                start = 0
+            grams = zip(*(window[start + i:] for i in range(n)))
+            sketch.add_counts(Counter(' '.join(gram) for gram in grams))
+        self.carry = window[-(max(self.ngrams, default=1) - 1):] if self.ngrams else []
+
+    def update(self, tokens):
+        chunk = []
+        for token in tokens:
+            chunk.append(token)
+            self.total_token_chars += len(token)
+            if len(chunk) >= CHUNK_SIZE:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        self.total_tokens = self.tokens.total
+
+    def result(self):
+        return {
+            'total_tokens': self.total_tokens,
+            'avg_token_length': self.total_token_chars / self.total_tokens if self.total_tokens > 0 else 0,
+            'approx_unique_count': self.hll.count(),
+            'unique_relative_error': self.hll.relative_error,
+            'most_common': self.tokens.most_common(),
+            'count_error_bound': self.tokens.error_bound,
+            'count_confidence': 1 - self.tokens.delta,
+            'ngrams': {n: sketch.most_common() for n, sketch in self.ngrams.items()},
+            'ngram_error_bounds': {n: sketch.error_bound for n, sketch in self.ngrams.items()},
+            'memory_bytes': self.hll.memory_bytes + self.tokens.memory_bytes
+                            + sum(sketch.memory_bytes for sketch in self.ngrams.values()),
+        }
+
+def sketch_tokenize_text(source, top_k=10):
+    """Approximate counterpart of tokenize_text for a string or a stream of lines"""
+    if isinstance(source, str):
+        source = (source,)
+    
+    char_counts = {'total_chars': 0, 'chars_no_spaces': 0}
+    def counted(chunks):
+        for chunk in chunks:
+            char_counts['total_chars'] += len(chunk)
+            char_counts['chars_no_spaces'] += len(chunk) - chunk.count(' ')
+            yield chunk
+    
+    stats = StreamingTokenStats(top_k=top_k)
+    stats.update(iter_tokens(counted(source)))
+    return {**stats.result(), **char_counts}
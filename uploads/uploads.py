@@ -0,0 +1,137 @@
+from flask import Request, current_app, request
+from werkzeug.exceptions import UnsupportedMediaType
+import hashlib
+import os
+import shutil
+import tempfile
+
+# Uploads stay in memory up to this size, then roll over to a file under UPLOAD_FOLDER
+SPOOL_MEMORY_BYTES = int(os.getenv('UPLOAD_SPOOL_MEMORY_BYTES', str(1024 * 1024)))
+
+# Enough leading bytes to recognise every signature below
+SNIFF_BYTES = 16
+
+MAGIC_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'\x93NUMPY', 'npy'),
+]
+
+IMAGE_KINDS = ('png', 'jpeg', 'gif', 'bmp', 'tiff')
+
+def sniff_kind(head):
+    """Identify a file from its first bytes: an image kind, 'text', or None"""
+    for signature, kind in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if b'\x00' not in head:
+        return 'text'
+    return None
+
+class SpooledUpload(tempfile.SpooledTemporaryFile):
+    """Upload container that hashes and type-checks data as the multipart parser writes it.
+
+    The type is checked as soon as the first SNIFF_BYTES have arrived, so a
+    rejected upload never gets buffered beyond its first chunk.
+    """
+
+    def __init__(self, accepted_kinds=None, max_size=SPOOL_MEMORY_BYTES, dir=None):
+        super().__init__(max_size=max_size, mode='w+b', prefix='upload-', dir=dir)
+        self.accepted_kinds = accepted_kinds
+        self.kind = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self._sniffed = False
+
+    def _sniff(self):
+        self._sniffed = True
+        self.kind = sniff_kind(self._head)
+        if self.accepted_kinds is not None and self.kind not in self.accepted_kinds:
+            if set(self.accepted_kinds) & set(IMAGE_KINDS):
+                raise UnsupportedMediaType('Invalid file type. Please upload an image file.')
+            raise UnsupportedMediaType('Invalid file type. Please upload a plain text file.')
+
+    def write(self, data):
+        if not self._sniffed:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        self._hash.update(data)
+        self.size += len(data)
+        return super().write(data)
+
+    def seek(self, *args):
+        # The parser rewinds once the part is complete; check files shorter than SNIFF_BYTES here
+        if not self._sniffed and self.size:
+            self._sniff()
+        return super().seek(*args)
+
+    @property
+    def digest(self):
+        """SHA-256 of everything written so far"""
+        return self._hash.hexdigest()
+
+class UploadRequest(Request):
+    """Request class whose file uploads are spooled, hashed and type-checked while parsing"""
+
+    @property
+    def max_content_length(self):
+        """MAX_UPLOAD_LENGTH for views marked with accepts_uploads, MAX_CONTENT_LENGTH otherwise"""
+        if self._max_content_length is None and current_app:
+            view = current_app.view_functions.get(self.endpoint)
+            if getattr(view, 'accepted_uploads', None) is not None:
+                return current_app.config.get('MAX_UPLOAD_LENGTH', current_app.config['MAX_CONTENT_LENGTH'])
+        return super().max_content_length
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        self._max_content_length = value
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        view = current_app.view_functions.get(self.endpoint)
+        return SpooledUpload(getattr(view, 'accepted_uploads', None), dir=current_app.config.get('UPLOAD_FOLDER'))
+
+def accepts_uploads(*kinds):
+    """Restrict the file kinds a view accepts; other uploads are rejected with 415 mid-parse.
+
+    Marked views may also receive bodies up to MAX_UPLOAD_LENGTH rather than
+    MAX_CONTENT_LENGTH, so they must spool or stream the body (multipart files,
+    spooled_body) instead of reading it into memory with get_data/get_json.
+    """
+    def decorator(view):
+        view.accepted_uploads = frozenset(kinds)
+        return view
+    return decorator
+
+def spooled_body():
+    """Copy the raw request body into a SpooledUpload, type-checked against the view's accepted kinds.
+
+    Raises ValueError if the body is not of an accepted kind.
+    """
+    view = current_app.view_functions.get(request.endpoint)
+    upload = SpooledUpload(getattr(view, 'accepted_uploads', None), dir=current_app.config.get('UPLOAD_FOLDER'))
+    try:
+        shutil.copyfileobj(request.stream, upload)
+        upload.seek(0)
+    except UnsupportedMediaType as e:
+        upload.close()
+        raise ValueError(e.description)
+    return upload
+
+def upload_digest(file):
+    """SHA-256 hex digest of an uploaded FileStorage, hashed during parsing when possible"""
+    digest = getattr(file.stream, 'digest', None)
+    if digest is not None:
+        return digest
+
+    file_hash = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+        file_hash.update(chunk)
+    file.stream.seek(0)
+    return file_hash.hexdigest()
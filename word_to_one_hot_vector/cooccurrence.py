@@ -0,0 +1,80 @@
+import numpy as np
+import time
+
+def encode_indices(words, vocab):
+    """Map words to their vocabulary indices, dropping unknown words"""
+    return np.fromiter((vocab[w] for w in (word.lower().strip() for word in words) if w in vocab), dtype=np.int64)
+
+class CooccurrenceIndex:
+    """Sparse word-word co-occurrence matrix (CSR) with a cosine nearest-neighbour query.
+
+    Only the encoded index array is needed: with X the (tokens x vocab) one-hot
+    matrix and S_d the shift-by-d matrix, C = sum_d X^T (S_d + S_d^T) X. Each
+    product pairs indices[:-d] with indices[d:], so C is built by counting
+    (row, col) keys in bulk instead of multiplying dense one-hot rows.
+    """
+
+    def __init__(self, indices, vocab_size, window=2):
+        start = time.perf_counter()
+        self.vocab_size = vocab_size
+        self.window = window
+        self.num_tokens = len(indices)
+
+        rows, cols = [], []
+        for d in range(1, window + 1):
+            left, right = indices[:-d], indices[d:]
+            rows += [left, right]
+            cols += [right, left]
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+
+        # Sum duplicate (row, col) entries; unique keys come back sorted in CSR order
+        keys, counts = np.unique(rows * vocab_size + cols, return_counts=True)
+        self.indices = (keys % vocab_size).astype(np.int32)
+        self.data = counts.astype(np.float32)
+        row_of_entry = (keys // vocab_size).astype(np.int32)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(row_of_entry, minlength=vocab_size))))
+
+        # Precompute L2-normalized rows so a query is one sparse mat-vec
+        norms = np.sqrt(np.bincount(row_of_entry, weights=self.data.astype(np.float64) ** 2, minlength=vocab_size))
+        self._row_of_entry = row_of_entry
+        self._normalized = (self.data / np.where(norms > 0, norms, 1)[row_of_entry]).astype(np.float32)
+
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row(self, index):
+        """Return (column indices, counts) of one vocabulary row"""
+        start, end = self.indptr[index], self.indptr[index + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def nearest(self, index, k=10):
+        """Top-k most similar vocabulary indices by cosine similarity, as (index, score) pairs"""
+        start, end = self.indptr[index], self.indptr[index + 1]
+        if start == end:
+            return []
+
+        query = np.zeros(self.vocab_size, dtype=np.float32)
+        query[self.indices[start:end]] = self._normalized[start:end]
+        scores = np.bincount(self._row_of_entry, weights=self._normalized * query[self.indices],
+                             minlength=self.vocab_size)
+        scores[index] = -1  # Never return the query word itself
+
+        k = min(k, self.vocab_size - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def memory_report(self):
+        """Bytes used by dense versus sparse representations of the same data"""
+        return {
+            'dense_one_hot': self.num_tokens * self.vocab_size * 8,  # float64, as words_to_one_hot_matrix builds it
+            'index_array': self.num_tokens * 8,
+            'dense_cooccurrence': self.vocab_size * self.vocab_size * 4,
+            'sparse_cooccurrence': self.data.nbytes + self.indices.nbytes + self.indptr.nbytes,
+        }
@@ -1,6 +1,14 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response
 import numpy as np
+import io
 import json
+import re
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from word_to_one_hot_vector.cooccurrence import CooccurrenceIndex, encode_indices
+from http_cache.http_cache import cached_page
 
 one_hot_vector_bp = Blueprint('one_hot_vector', __name__)
 
@@ -35,7 +43,71 @@ def words_to_one_hot_matrix(words, vocab):
     
     return np.array(matrix), valid_words
 
+# Recently built co-occurrence indexes, keyed by a hash of the input and window
+INDEX_CACHE_SIZE = 8
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def parse_words(words_input):
+    """Split input on commas, newlines or spaces"""
+    words = re.split(r'[,\n\s]+', words_input)
+    return [word.strip() for word in words if word.strip()]
+
+def get_cooccurrence_index(key):
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+    return None
+
+def store_cooccurrence_index(key, entry):
+    with _index_cache_lock:
+        _index_cache[key] = entry
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+
+EXPORT_CHUNK_BYTES = 4 * 1024 * 1024  # Dense rows are generated this much at a time
+EXPORT_DTYPES = {'uint8': np.uint8, 'float32': np.float32, 'float64': np.float64}
+
+def npy_header(shape, dtype):
+    """Bytes of a .npy header for an array that will be streamed after it"""
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order': False,
+        'shape': shape
+    })
+    return buffer.getvalue()
+
+def iter_dense_one_hot(indices, vocab_size, dtype):
+    """Yield the dense one-hot matrix as raw row-major bytes, one chunk of rows at a time"""
+    rows_per_chunk = max(1, EXPORT_CHUNK_BYTES // max(1, vocab_size * np.dtype(dtype).itemsize))
+    for start in range(0, len(indices), rows_per_chunk):
+        chunk_indices = indices[start:start + rows_per_chunk]
+        chunk = np.zeros((len(chunk_indices), vocab_size), dtype=dtype)
+        chunk[np.arange(len(chunk_indices)), chunk_indices] = 1
+        yield chunk.tobytes()
+
+def sparse_one_hot_npz(indices, vocab_size, unique_words):
+    """CSR one-hot matrix in the scipy.sparse.save_npz layout, plus the vocabulary"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer,
+                        format=np.array('csr'),
+                        shape=np.array([len(indices), vocab_size]),
+                        data=np.ones(len(indices), dtype=np.uint8),
+                        indices=indices.astype(np.int32),
+                        indptr=np.arange(len(indices) + 1, dtype=np.int64),
+                        vocabulary=np.array(unique_words))
+    return buffer.getvalue()
+
+def iter_index_rows(words, indices):
+    """Yield one JSON line per word with its vocabulary index"""
+    for word, idx in zip(words, indices.tolist()):
+        yield json.dumps({'word': word, 'index': idx}) + '\n'
+
 @one_hot_vector_bp.route('/')
+@cached_page
 def index():
     return render_template('one_hot_vector/index.html')
 
@@ -50,9 +122,7 @@ def process_words():
     
     try:
         # Parse words (split by commas, newlines, or spaces)
-        import re
-        words = re.split(r'[,\n\s]+', words_input)
-        words = [word.strip() for word in words if word.strip()]
+        words = parse_words(words_input)
         
         if len(words) < 2:
             flash('Please enter at least 2 words.')
@@ -101,3 +171,120 @@ def process_words():
     except Exception as e:
         flash(f'Error processing words: {str(e)}')
         return redirect(url_for('one_hot_vector.index'))
+
+@one_hot_vector_bp.route('/cooccurrence', methods=['POST'])
+def cooccurrence():
+    words_input = request.form.get('words', '').strip()
+    selected_word = request.form.get('selected_word', '').strip().lower()
+    
+    if not words_input:
+        flash('Please enter some words.')
+        return redirect(url_for('one_hot_vector.index'))
+    
+    try:
+        window = max(1, min(int(request.form.get('window', 2)), 10))
+    except ValueError:
+        window = 2
+    
+    try:
+        words = parse_words(words_input)
+        if len(words) < 2:
+            flash('Please enter at least 2 words.')
+            return redirect(url_for('one_hot_vector.index'))
+        
+        key = hashlib.sha256(f'{window}:{words_input}'.encode('utf-8')).hexdigest()
+        entry = get_cooccurrence_index(key)
+        if entry is None:
+            vocab, unique_words = create_vocabulary(words)
+            cooc_index = CooccurrenceIndex(encode_indices(words, vocab), len(vocab), window)
+            entry = {'vocab': vocab, 'unique_words': unique_words, 'index': cooc_index}
+            store_cooccurrence_index(key, entry)
+        
+        vocab, unique_words, cooc_index = entry['vocab'], entry['unique_words'], entry['index']
+        if selected_word not in vocab:
+            if selected_word:
+                flash(f'Selected word "{selected_word}" not found in vocabulary.')
+            # Default to the word with the most co-occurrences
+            selected_word = unique_words[int(np.argmax(np.diff(cooc_index.indptr)))]
+        
+        neighbors = [(unique_words[i], score) for i, score in cooc_index.nearest(vocab[selected_word])]
+        
+        return render_template('one_hot_vector/cooccurrence.html',
+                             index_key=key,
+                             num_tokens=cooc_index.num_tokens,
+                             vocab_size=len(vocab),
+                             window=window,
+                             nnz=cooc_index.nnz,
+                             build_ms=cooc_index.build_ms,
+                             memory=cooc_index.memory_report(),
+                             selected_word=selected_word,
+                             neighbors=neighbors)
+    
+    except Exception as e:
+        flash(f'Error building co-occurrence index: {str(e)}')
+        return redirect(url_for('one_hot_vector.index'))
+
+@one_hot_vector_bp.route('/similar', methods=['POST'])
+def similar_words():
+    """Nearest-word query against a cached co-occurrence index via AJAX"""
+    try:
+        data = request.get_json()
+        entry = get_cooccurrence_index(data.get('index_key', ''))
+        if entry is None:
+            return jsonify({'error': 'Index expired. Please build it again.'}), 404
+        
+        word = data.get('word', '').strip().lower()
+        if word not in entry['vocab']:
+            return jsonify({'error': f'"{word}" is not in the vocabulary'}), 400
+        
+        k = max(1, min(int(data.get('k', 10)), 100))
+        start = time.perf_counter()
+        neighbors = entry['index'].nearest(entry['vocab'][word], k)
+        
+        return jsonify({
+            'success': True,
+            'word': word,
+            'neighbors': [{'word': entry['unique_words'][i], 'score': score} for i, score in neighbors],
+            'query_ms': (time.perf_counter() - start) * 1000
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@one_hot_vector_bp.route('/export/<export_format>', methods=['POST'])
+def export_encoding(export_format):
+    """Download the one-hot encoding as .npz (sparse), .npy (dense) or JSONL index rows"""
+    words_input = request.form.get('words', '').strip()
+    if not words_input:
+        flash('Please enter some words.')
+        return redirect(url_for('one_hot_vector.index'))
+    
+    words = parse_words(words_input)
+    vocab, unique_words = create_vocabulary(words)
+    indices = encode_indices(words, vocab)
+    valid_words = [word.lower().strip() for word in words]
+    
+    if export_format == 'npz':
+        return Response(sparse_one_hot_npz(indices, len(vocab), unique_words),
+                        mimetype='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename=one_hot.npz'})
+    
+    if export_format == 'npy':
+        dtype = EXPORT_DTYPES.get(request.form.get('dtype', 'uint8'), np.uint8)
+        header = npy_header((len(indices), len(vocab)), dtype)
+        size = len(header) + len(indices) * len(vocab) * np.dtype(dtype).itemsize
+        
+        def generate():
+            yield header
+            yield from iter_dense_one_hot(indices, len(vocab), dtype)
+        
+        return Response(generate(), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename=one_hot.npy',
+                                 'Content-Length': str(size)})
+    
+    if export_format == 'jsonl':
+        return Response(iter_index_rows(valid_words, indices), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': 'attachment; filename=one_hot_indices.jsonl'})
+    
+    flash(f'Unknown export format "{export_format}".')
+    return redirect(url_for('one_hot_vector.index'))